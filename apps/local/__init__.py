@@ -1,3 +1,4 @@
 from .app import App
+from .schemas import VideoSource
 
-__all__ = ["App"]
+__all__ = ["App", "VideoSource"]
@@ -0,0 +1,158 @@
+import math
+from dataclasses import dataclass
+from datetime import datetime
+from threading import Lock
+
+import numpy as np
+
+from libs.schemas.analysis_msg import AnalysisMsg
+
+# The columns of the samples of each analysis result.
+_LEFT_EAR, _RIGHT_EAR, _HEAD_X, _HEAD_Y = range(4)
+
+
+@dataclass(slots=True, frozen=True)
+class AnalysisStats:
+    """Represent the statistics of the buffered analysis results.
+
+    Attributes:
+        size (int): The number of results.
+        absent_count (int): The number of results where the face is absent.
+        ear_count (int): The number of results with eye aspect ratios.
+        left_ear_below_count (int): The number of results whose left eye aspect ratio is below the threshold.
+        right_ear_below_count (int): The number of results whose right eye aspect ratio is below the threshold.
+        head_direction_count (int): The number of results with head directions.
+        head_direction_mean (tuple[float, float]): The mean of the horizontal and vertical head directions. Both are 0 if there is no head direction.
+        head_direction_std (tuple[float, float]): The standard deviation of the horizontal and vertical head directions. Both are 0 if there is no head direction.
+    """
+
+    size: int
+    absent_count: int
+    ear_count: int
+    left_ear_below_count: int
+    right_ear_below_count: int
+    head_direction_count: int
+    head_direction_mean: tuple[float, float]
+    head_direction_std: tuple[float, float]
+
+
+class AnalysisBuffer:
+    """Keep the latest analysis results in a ring buffer of fixed capacity, with running statistics.
+
+    The statistics are updated when a result is appended or evicted, so that reading them takes constant time
+    regardless of the capacity. The sums are recomputed from the samples each time the buffer wraps around,
+    so that rounding errors do not accumulate. All methods are thread-safe.
+    """
+
+    def __init__(self, capacity: int, ear_threshold: float) -> None:
+        """
+        Args:
+            capacity (int): The maximum number of results. The oldest result is evicted when a result is appended to a full buffer.
+            ear_threshold (float): The eye aspect ratio below which an eye is counted as closed.
+        """
+        self._capacity = capacity
+        self._ear_threshold = ear_threshold
+        self._lock = Lock()
+
+        self._samples = np.zeros((capacity, 4))
+        self._is_absent = np.zeros(capacity, dtype=bool)
+        self._has_ear = np.zeros(capacity, dtype=bool)
+        self._has_head_direction = np.zeros(capacity, dtype=bool)
+        self._next = 0
+        self._size = 0
+        self._latest_timestamp: datetime | None = None
+
+        self._absent_count = 0
+        self._ear_count = 0
+        self._left_ear_below_count = 0
+        self._right_ear_below_count = 0
+        self._head_direction_count = 0
+        self._head_direction_sum = np.zeros(2)
+        self._head_direction_sq_sum = np.zeros(2)
+
+    def append(self, msg: AnalysisMsg) -> None:
+        """Append a result, evicting the oldest one if the buffer is full."""
+        with self._lock:
+            i = self._next
+            if self._size == self._capacity:
+                self._update_counts(i, -1)
+            else:
+                self._size += 1
+
+            self._is_absent[i] = msg.is_absent
+            self._has_ear[i] = msg.both_eye_aspect_ratio is not None
+            self._has_head_direction[i] = msg.head_direction is not None
+            if msg.both_eye_aspect_ratio is not None:
+                self._samples[i, _LEFT_EAR] = msg.both_eye_aspect_ratio.left
+                self._samples[i, _RIGHT_EAR] = msg.both_eye_aspect_ratio.right
+            if msg.head_direction is not None:
+                self._samples[i, _HEAD_X] = msg.head_direction.x
+                self._samples[i, _HEAD_Y] = msg.head_direction.y
+            self._update_counts(i, 1)
+            self._latest_timestamp = msg.timestamp
+
+            self._next = (i + 1) % self._capacity
+            if self._next == 0:
+                self._recompute_sums()
+
+    def clear_before(self, time: datetime) -> None:
+        """Remove all results if the latest one was recorded before the given time."""
+        with self._lock:
+            if self._latest_timestamp is None or self._latest_timestamp >= time:
+                return
+
+            self._next = 0
+            self._size = 0
+            self._latest_timestamp = None
+            self._absent_count = 0
+            self._ear_count = 0
+            self._left_ear_below_count = 0
+            self._right_ear_below_count = 0
+            self._head_direction_count = 0
+            self._head_direction_sum[:] = 0.0
+            self._head_direction_sq_sum[:] = 0.0
+
+    @property
+    def stats(self) -> AnalysisStats:
+        with self._lock:
+            count = self._head_direction_count
+            if count:
+                mean = self._head_direction_sum / count
+                variance = np.maximum(self._head_direction_sq_sum / count - mean * mean, 0.0)
+                head_direction_mean = (float(mean[0]), float(mean[1]))
+                head_direction_std = (math.sqrt(variance[0]), math.sqrt(variance[1]))
+            else:
+                head_direction_mean = head_direction_std = (0.0, 0.0)
+
+            return AnalysisStats(
+                size=self._size,
+                absent_count=self._absent_count,
+                ear_count=self._ear_count,
+                left_ear_below_count=self._left_ear_below_count,
+                right_ear_below_count=self._right_ear_below_count,
+                head_direction_count=count,
+                head_direction_mean=head_direction_mean,
+                head_direction_std=head_direction_std,
+            )
+
+    def _update_counts(self, i: int, sign: int) -> None:
+        # Adds the sample at the index to the statistics, or removes it with a negative sign.
+        sample = self._samples[i]
+        if self._is_absent[i]:
+            self._absent_count += sign
+        if self._has_ear[i]:
+            self._ear_count += sign
+            if sample[_LEFT_EAR] < self._ear_threshold:
+                self._left_ear_below_count += sign
+            if sample[_RIGHT_EAR] < self._ear_threshold:
+                self._right_ear_below_count += sign
+        if self._has_head_direction[i]:
+            head_direction = sample[_HEAD_X:]
+            self._head_direction_count += sign
+            self._head_direction_sum += sign * head_direction
+            self._head_direction_sq_sum += sign * head_direction * head_direction
+
+    def _recompute_sums(self) -> None:
+        head_directions = self._samples[self._has_head_direction, _HEAD_X:]
+        self._head_direction_sum = head_directions.sum(axis=0)
+        self._head_direction_sq_sum = (head_directions * head_directions).sum(axis=0)
@@ -1,116 +1,162 @@
-from collections import deque
 from datetime import datetime, timedelta
-from typing import Deque
-
-import cv2
-import numpy as np
+from functools import partial
+from threading import Thread
+from typing import Mapping
 
 from libs.ipc import BasePublisher, BaseSubscriber
 from libs.schemas.analysis_msg import AnalysisMsg
-from libs.schemas.monitor_msg import ConcentrationStatus, MonitorMsg, PenaltyFactor
+from libs.schemas.monitor_msg import ConcentrationStatus, PenaltyFactor
 from libs.types import MatLike
 
+from .analysis_buffer import AnalysisBuffer, AnalysisStats
+from .capture import FrameCapture
+from .monitor_scheduler import MonitorScheduler
+from .schemas import VideoSource
+
 CLEAR_BUFFER_INTERVAL = timedelta(seconds=1)
 
 
+class _Source:
+    """Hold the capturing and scoring state of a video source."""
+
+    def __init__(
+        self,
+        source_id: str,
+        source: VideoSource,
+        *,
+        capture_prefetch_size: int,
+        replay_factor: float,
+        max_buffer_size: int,
+        ear_threshold: float,
+    ) -> None:
+        self.id = source_id
+        self.frame_publisher: BasePublisher[MatLike] = source.frame_publisher
+        self.analysis_msg_subscriber: BaseSubscriber[AnalysisMsg] = source.analysis_msg_subscriber
+
+        self.frame_capture = FrameCapture(
+            source.video_path_or_device_id,
+            prefetch_size=capture_prefetch_size,
+            replay_factor=replay_factor,
+        )
+        # The buffer is appended by the subscriber thread while the scheduler thread reads it.
+        self.analysis_buffer = AnalysisBuffer(max_buffer_size, ear_threshold)
+
+
 class App:
     def __init__(
         self,
-        monitor_msg_publisher: BasePublisher[MonitorMsg],
-        frame_publisher: BasePublisher[MatLike],
-        analysis_msg_subscriber: BaseSubscriber[AnalysisMsg],
+        sources: Mapping[str, VideoSource],
         *,
-        video_path_or_device_id: str | int = 0,
+        capture_prefetch_size: int = 2,
+        replay_factor: float = 1.0,
         max_buffer_size: int = 10,
         ear_threshold: float = 0.25,
         looking_away_x_threshold: float = 25.0,
         looking_away_penalty: float = 50.0,
         head_direction_std_weight: float = 50.0,
+        monitor_rate: float = 5.0,
+        monitor_change_threshold: float = 0.0,
+        monitor_heartbeat_interval: float = 5.0,
     ) -> None:
-        self._monitor_msg_publisher = monitor_msg_publisher
-        self._frame_publisher = frame_publisher
-        self._analysis_msg_subscriber = analysis_msg_subscriber
-
-        self._video_path_or_device_id = video_path_or_device_id
+        """
+        Args:
+            sources (Mapping[str, VideoSource]): The video sources to capture and score, keyed by stream id.
+            capture_prefetch_size (int, optional): The maximum number of frames of each source queued for publishing.
+            replay_factor (float, optional): The speed at which video files are played relative to their native frame rate. If 0, they are read as fast as possible.
+            max_buffer_size (int, optional): The maximum number of analysis results of each source used for scoring.
+            ear_threshold (float, optional): The eye aspect ratio below which an eye is counted as closed.
+            looking_away_x_threshold (float, optional): The horizontal head direction from which the person is looking away.
+            looking_away_penalty (float, optional): The score subtracted when the person is looking away.
+            head_direction_std_weight (float, optional): The weight of the standard deviation of the head directions subtracted from the score.
+            monitor_rate (float, optional): The number of times per second the status of each source is calculated.
+            monitor_change_threshold (float, optional): The change of the score required to publish the status. If 0, the status is published every time it is calculated.
+            monitor_heartbeat_interval (float, optional): The maximum time (in seconds) between published statuses when they do not change.
+        """
         self._max_buffer_size = max_buffer_size
-        self._ear_threshold = ear_threshold
         self._looking_away_x_threshold = looking_away_x_threshold
         self._looking_away_penalty = looking_away_penalty
         self._head_direction_std_weight = head_direction_std_weight
 
-        self._analysis_msg_buffer: Deque[AnalysisMsg] = deque(maxlen=max_buffer_size)
+        # Capturing, encoding and publishing frames, and scoring run on threads of their own for each source,
+        # so that they overlap and a slow source does not hold back the others.
+        self._sources = {
+            source_id: _Source(
+                source_id,
+                source,
+                capture_prefetch_size=capture_prefetch_size,
+                replay_factor=replay_factor,
+                max_buffer_size=max_buffer_size,
+                ear_threshold=ear_threshold,
+            )
+            for source_id, source in sources.items()
+        }
+        self._monitor_schedulers = [
+            MonitorScheduler(
+                source.monitor_msg_publisher,
+                partial(self._calc_status, self._sources[source_id].analysis_buffer),
+                rate=monitor_rate,
+                change_threshold=monitor_change_threshold,
+                heartbeat_interval=monitor_heartbeat_interval,
+            )
+            for source_id, source in sources.items()
+        ]
 
     def run(self) -> None:
-        self._analysis_msg_subscriber.start(self._on_analysis_msg)
-        cap = cv2.VideoCapture(self._video_path_or_device_id)
-
+        for source in self._sources.values():
+            source.analysis_msg_subscriber.start(source.analysis_buffer.append)
+            source.frame_capture.start()
+        for monitor_scheduler in self._monitor_schedulers:
+            monitor_scheduler.start()
+
+        threads = [
+            Thread(target=self._publish_frames, args=(source,), daemon=True)
+            for source in self._sources.values()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _publish_frames(self, source: _Source) -> None:
+        # This thread encodes and publishes the frames of the source.
         while 1:
-            ret, frame = cap.read()
-            if not ret:
-                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                continue
-
-            if len(self._analysis_msg_buffer) > 0:
-                latest = self._analysis_msg_buffer[-1]
-                if datetime.now() - latest.timestamp > CLEAR_BUFFER_INTERVAL:
-                    self._analysis_msg_buffer.clear()
-
-            self._frame_publisher.publish(frame)
-            self._publish_monitor_msg()
-
-    def _publish_monitor_msg(self) -> None:
-        score, factor = self._calc_score()
-        self._monitor_msg_publisher.publish(
-            MonitorMsg(
-                timestamp=datetime.now(),
-                payload=ConcentrationStatus(overall_score=score, penalty_factor=factor),
-            )
-        )
+            frame = source.frame_capture.get()
+            if frame is not None:
+                source.frame_publisher.publish(frame)
+
+    def _calc_status(self, analysis_buffer: AnalysisBuffer) -> ConcentrationStatus:
+        analysis_buffer.clear_before(datetime.now() - CLEAR_BUFFER_INTERVAL)
+        score, factor = self._calc_score(analysis_buffer.stats)
+        return ConcentrationStatus(overall_score=score, penalty_factor=factor)
 
-    def _calc_score(self) -> tuple[float, PenaltyFactor]:
-        if len(self._analysis_msg_buffer) == 0:
+    def _calc_score(self, stats: AnalysisStats) -> tuple[float, PenaltyFactor]:
+        if stats.size == 0:
             return (0.0, PenaltyFactor.NONE)
 
-        if all(msg.is_absent for msg in self._analysis_msg_buffer):
+        if stats.absent_count == stats.size:
             return (0.0, PenaltyFactor.IS_ABSENT)
 
-        ears = np.array(
-            [
-                [msg.both_eye_aspect_ratio.left, msg.both_eye_aspect_ratio.right]
-                for msg in self._analysis_msg_buffer
-                if msg.both_eye_aspect_ratio
-            ]
-        )
-        if len(ears) >= 0.8 * self._max_buffer_size and self._check_drowsiness(ears):
+        if stats.ear_count >= 0.8 * self._max_buffer_size and self._check_drowsiness(stats):
             return (0.0, PenaltyFactor.IS_DROWSY)
 
         score = 100.0
         factor = PenaltyFactor.NONE
 
-        head_directions = np.array(
-            [
-                [msg.head_direction.x, msg.head_direction.y]
-                for msg in self._analysis_msg_buffer
-                if msg.head_direction
-            ]
-        )
-        head_direction_mean = np.mean(head_directions, axis=0)
-        is_head_down = head_direction_mean[1] < 0.0
-        if not is_head_down and abs(head_direction_mean[0]) >= self._looking_away_x_threshold:
+        # Without head directions, there is nothing to penalize.
+        if stats.head_direction_count == 0:
+            return (score, factor)
+
+        head_direction_mean_x, head_direction_mean_y = stats.head_direction_mean
+        is_head_down = head_direction_mean_y < 0.0
+        if not is_head_down and abs(head_direction_mean_x) >= self._looking_away_x_threshold:
             score -= self._looking_away_penalty
             factor |= PenaltyFactor.IS_LOOKING_AWAY
 
-        head_direction_std = np.std(head_directions, axis=0)
-        score -= self._head_direction_std_weight * float(np.mean(head_direction_std / 20))
+        head_direction_std_mean = sum(stats.head_direction_std) / 2
+        score -= self._head_direction_std_weight * head_direction_std_mean / 20
 
         return (max(0.0, min(100.0, score)), factor)
 
-    def _on_analysis_msg(self, analysis_msg: AnalysisMsg) -> None:
-        self._analysis_msg_buffer.append(analysis_msg)
-
-    def _check_drowsiness(self, ears: np.ndarray) -> bool:
-        half_len = 0.5 * len(ears)
-        return (
-            len(ears[ears[:, 0] < self._ear_threshold]) >= half_len
-            or len(ears[ears[:, 1] < self._ear_threshold]) >= half_len
-        )
+    def _check_drowsiness(self, stats: AnalysisStats) -> bool:
+        half_len = 0.5 * stats.ear_count
+        return stats.left_ear_below_count >= half_len or stats.right_ear_below_count >= half_len
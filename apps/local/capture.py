@@ -0,0 +1,129 @@
+import os
+import queue
+from threading import Event, Thread
+from time import monotonic
+
+import cv2
+
+from libs.types import MatLike
+
+# The time (in seconds) to wait after the first failed read, which doubles up to the maximum on each failure.
+RETRY_INTERVAL = 0.05
+MAX_RETRY_INTERVAL = 2.0
+# The number of consecutive failed reads after which the source is reopened, e.g. when a camera was reconnected.
+REOPEN_AFTER_FAILURES = 5
+
+
+class FrameCapture:
+    """Capture frames on a thread of its own into a small prefetch queue.
+
+    Frames of video files are paced to their native frame rate multiplied by a replay factor, and the files are looped.
+    Frames of cameras are read as they come. When the consumer does not keep up, the oldest queued frame is dropped,
+    so that the consumer always gets recent frames. Failed reads are retried with a backoff, and the source is reopened
+    after repeated failures, e.g. when a camera is disconnected.
+    """
+
+    def __init__(
+        self,
+        video_path_or_device_id: str | int,
+        *,
+        prefetch_size: int = 2,
+        replay_factor: float = 1.0,
+    ) -> None:
+        """
+        Args:
+            video_path_or_device_id (str | int): The path of a video file, or the id or URL of a camera.
+            prefetch_size (int, optional): The maximum number of frames queued for the consumer.
+            replay_factor (float, optional): The speed at which video files are played relative to their native frame rate. If 0, they are read as fast as possible.
+        """
+        self._video_path_or_device_id = video_path_or_device_id
+        self._is_file = isinstance(video_path_or_device_id, str) and os.path.isfile(
+            video_path_or_device_id
+        )
+        self._replay_factor = replay_factor
+
+        self._queue: queue.Queue[MatLike] = queue.Queue(prefetch_size)
+        self._stop_event = Event()
+        self._thread: Thread | None = None
+
+    def start(self) -> None:
+        """Begin capturing frames.
+
+        Raises:
+            RuntimeError: If the capture is already running.
+        """
+        if self._thread is not None:
+            raise RuntimeError("Capture is already running")
+
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def get(self, timeout: float | None = None) -> MatLike | None:
+        """Take the oldest queued frame, waiting for one if there is none.
+
+        Args:
+            timeout (float | None, optional): The maximum time (in seconds) to wait for a frame. If `None`, waits indefinitely.
+
+        Returns:
+            MatLike | None: The frame, or `None` if the timeout was reached.
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        """Stop capturing frames."""
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self) -> None:
+        cap = cv2.VideoCapture(self._video_path_or_device_id)
+        frame_interval = 0.0
+        if self._is_file and self._replay_factor > 0:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            if fps > 0:
+                frame_interval = 1 / (fps * self._replay_factor)
+
+        next_time = monotonic()
+        failures = 0
+        retry_interval = RETRY_INTERVAL
+        try:
+            while not self._stop_event.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    failures += 1
+                    if self._is_file and failures == 1:
+                        # The end of the file, which is looped.
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    if failures % REOPEN_AFTER_FAILURES == 0:
+                        cap.release()
+                        cap = cv2.VideoCapture(self._video_path_or_device_id)
+                    self._stop_event.wait(retry_interval)
+                    retry_interval = min(2 * retry_interval, MAX_RETRY_INTERVAL)
+                    next_time = monotonic()
+                    continue
+                failures = 0
+                retry_interval = RETRY_INTERVAL
+
+                self._put(frame)
+
+                if frame_interval:
+                    # Frames are paced from the schedule rather than from the previous frame, so that the rate does not drift.
+                    next_time = max(next_time + frame_interval, monotonic() - frame_interval)
+                    self._stop_event.wait(max(next_time - monotonic(), 0))
+        finally:
+            cap.release()
+
+    def _put(self, frame: MatLike) -> None:
+        # The capture thread is the only producer, so a slot is free once the oldest frame is dropped.
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(frame)
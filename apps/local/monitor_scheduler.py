@@ -0,0 +1,85 @@
+import math
+from datetime import datetime
+from threading import Event, Thread
+from time import monotonic
+from typing import Callable
+
+from libs.ipc import BasePublisher
+from libs.schemas.monitor_msg import ConcentrationStatus, MonitorMsg
+
+
+class MonitorScheduler:
+    """Score and publish the concentration status on a timer of its own, independently of the frame rate of the camera.
+
+    The status is calculated at a fixed rate. With a change threshold, it is only published when its score moved by at least
+    the threshold or its penalty factor changed since the last published status, or when nothing was published
+    for the heartbeat interval, so that subscribers can still tell that the app is alive.
+    """
+
+    def __init__(
+        self,
+        publisher: BasePublisher[MonitorMsg],
+        calc_status: Callable[[], ConcentrationStatus],
+        *,
+        rate: float = 5.0,
+        change_threshold: float = 0.0,
+        heartbeat_interval: float = 5.0,
+    ) -> None:
+        """
+        Args:
+            publisher (BasePublisher[MonitorMsg]): Publisher to send the status to.
+            calc_status (Callable[[], ConcentrationStatus]): Function to calculate the current status.
+            rate (float, optional): The number of times per second the status is calculated.
+            change_threshold (float, optional): The change of the score required to publish the status. If 0, the status is published every time it is calculated.
+            heartbeat_interval (float, optional): The maximum time (in seconds) between published statuses when they do not change.
+        """
+        self._publisher = publisher
+        self._calc_status = calc_status
+        self._interval = 1 / rate
+        self._change_threshold = change_threshold
+        self._heartbeat_interval = heartbeat_interval
+
+        self._stop_event = Event()
+        self._thread: Thread | None = None
+        self._last_status: ConcentrationStatus | None = None
+        self._last_published_time = -math.inf
+
+    def start(self) -> None:
+        """Begin publishing the status.
+
+        Raises:
+            RuntimeError: If the scheduler is already running.
+        """
+        if self._thread is not None:
+            raise RuntimeError("Scheduler is already running")
+
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stop publishing the status."""
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self) -> None:
+        # Ticks are scheduled from the previous one rather than from the end of the work, so that the rate does not drift.
+        next_time = monotonic()
+        while not self._stop_event.wait(max(next_time - monotonic(), 0)):
+            now = monotonic()
+            next_time = max(next_time + self._interval, now)
+
+            status = self._calc_status()
+            if self._should_publish(status, now):
+                self._publisher.publish(MonitorMsg(timestamp=datetime.now(), payload=status))
+                self._last_status = status
+                self._last_published_time = now
+
+    def _should_publish(self, status: ConcentrationStatus, now: float) -> bool:
+        last_status = self._last_status
+        return (
+            last_status is None
+            or now - self._last_published_time >= self._heartbeat_interval
+            or status.penalty_factor != last_status.penalty_factor
+            or abs(status.overall_score - last_status.overall_score) >= self._change_threshold
+        )
@@ -0,0 +1,22 @@
+from typing import NamedTuple
+
+from libs.ipc import BasePublisher, BaseSubscriber
+from libs.schemas.analysis_msg import AnalysisMsg
+from libs.schemas.monitor_msg import MonitorMsg
+from libs.types import MatLike
+
+
+class VideoSource(NamedTuple):
+    """Represent a video source and the communication channels of its stream.
+
+    Attributes:
+        video_path_or_device_id (str | int): The path of a video file, or the id or URL of a camera.
+        monitor_msg_publisher (BasePublisher[MonitorMsg]): The publisher sending the concentration status of the person in front of the source.
+        frame_publisher (BasePublisher[MatLike]): The publisher sending the frames of the source.
+        analysis_msg_subscriber (BaseSubscriber[AnalysisMsg]): The subscriber receiving the analysis results of the frames of the source.
+    """
+
+    video_path_or_device_id: str | int
+    monitor_msg_publisher: BasePublisher[MonitorMsg]
+    frame_publisher: BasePublisher[MatLike]
+    analysis_msg_subscriber: BaseSubscriber[AnalysisMsg]
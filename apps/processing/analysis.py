@@ -0,0 +1,47 @@
+import numpy as np
+from scipy.spatial import distance
+
+from libs.schemas.analysis_msg import BothEyeAspectRatio
+
+from .head_pose_estimator import HeadPoseEstimator
+from .schemas import Face, FacialLandmarks2d, FrameAnalysis, HeadPose
+
+
+def analyze_landmarks(
+    faces: list[Face],
+    landmarks: FacialLandmarks2d,
+    head_pose_estimator: HeadPoseEstimator,
+    image_size: tuple[int, int],
+) -> FrameAnalysis:
+    """Estimate the head pose and the eye aspect ratio from the facial landmarks.
+
+    Args:
+        faces (list[Face]): The detected faces.
+        landmarks (FacialLandmarks2d): The facial landmarks of the most confident face.
+        head_pose_estimator (HeadPoseEstimator): The head pose estimator of the stream.
+        image_size (tuple[int, int]): The height and width of the image.
+
+    Returns:
+        FrameAnalysis: The analysis result of the frame.
+    """
+    if not head_pose_estimator.is_image_size_set():
+        head_pose_estimator.set_image_size(*image_size)
+    pose = head_pose_estimator.estimate(landmarks)
+
+    both_ear = BothEyeAspectRatio(
+        left=calc_ear(landmarks.left_eye), right=calc_ear(landmarks.right_eye)
+    )
+    return FrameAnalysis(faces, landmarks, pose, both_ear)
+
+
+def project_pose(pose: HeadPose) -> tuple[float, float]:
+    x, y = np.sin(np.radians(pose.yaw)), -np.sin(np.radians(pose.pitch))
+    norm = np.linalg.norm((x, y))
+    return (float(x / norm), float(y / norm))
+
+
+def calc_ear(eye_landmarks: np.ndarray) -> float:
+    dist_p2_p6 = distance.euclidean(eye_landmarks[1], eye_landmarks[5])
+    dist_p3_p5 = distance.euclidean(eye_landmarks[2], eye_landmarks[4])
+    dist_p1_p4 = distance.euclidean(eye_landmarks[0], eye_landmarks[3])
+    return float((dist_p2_p6 + dist_p3_p5) / (2.0 * dist_p1_p4))
@@ -1,126 +1,249 @@
-import os
 import time
 from datetime import datetime
+from threading import Condition
+from typing import Mapping
 
 import cv2
 import numpy as np
-from scipy.spatial import distance
 
 from libs.ipc import BasePublisher, BaseSubscriber
-from libs.schemas.analysis_msg import AnalysisMsg, BothEyeAspectRatio
+from libs.schemas.analysis_msg import AnalysisMsg
 from libs.types import MatLike
 
-from .constants import MODELS_DIR
+from .analysis import analyze_landmarks, project_pose
+from .constants import (
+    FACE_DETECTOR_CONFIG_PATH,
+    FACE_DETECTOR_MODEL_PATH,
+    FACIAL_LANDMARKS_3D_PATH,
+    FACIAL_LANDMARKS_MODEL_PATH,
+)
 from .face_detector import FaceDetector
+from .face_tracker import FaceTracker
 from .facial_landmarks_detector import FacialLandmarksDetector
+from .frame_slot import FrameSlot
 from .head_pose_estimator import HeadPoseEstimator
-from .schemas import HeadPose
+from .pipeline import Pipeline
+from .schemas import Face, FrameAnalysis, FrameStats, StreamEndpoints
 
-SLEEP_INTERVAL = 0.01
+WAIT_TIMEOUT = 0.5
 
 
-class App:
+class _Stream:
+    """Hold the processing state of a frame stream."""
+
     def __init__(
         self,
-        frame_subscriber: BaseSubscriber[MatLike],
-        analysis_msg_publisher: BasePublisher[AnalysisMsg],
+        stream_id: str,
+        endpoints: StreamEndpoints,
+        frame_condition: Condition,
+        *,
+        face_redetect_interval: int,
     ) -> None:
-        self._frame_subscriber = frame_subscriber
-        self._analysis_msg_publisher = analysis_msg_publisher
+        self.id = stream_id
+        self.frame_subscriber: BaseSubscriber[MatLike] = endpoints.frame_subscriber
+        self.analysis_msg_publisher: BasePublisher[AnalysisMsg] = endpoints.analysis_msg_publisher
+        self.overlay_publisher: BasePublisher[MatLike] | None = endpoints.overlay_publisher
 
-        self._face_detector = FaceDetector(
-            os.path.join(MODELS_DIR, "opencv_face_detector_uint8.pb"),
-            os.path.join(MODELS_DIR, "opencv_face_detector.pbtxt"),
-        )
-        self._facial_landmarks_detector = FacialLandmarksDetector(
-            os.path.join(MODELS_DIR, "shape_predictor_68_face_landmarks_GTX.dat")
-        )
-        self._head_pose_estimator = HeadPoseEstimator(
-            os.path.join(MODELS_DIR, "facial_landmarks_3d.csv")
-        )
+        self.face_tracker = FaceTracker(redetect_interval=face_redetect_interval)
+        self.head_pose_estimator = HeadPoseEstimator(FACIAL_LANDMARKS_3D_PATH)
 
-        self._prev_time: float = time.time()
-        self._fps: float = 0
+        self.prev_time: float = time.time()
+        self.fps: float = 0
+        self.last_overlay_time: float = 0
 
-        self._latest_frame: MatLike | None = None
+        self.frame_slot = FrameSlot(frame_condition)
 
-    def run(self) -> None:
-        self._frame_subscriber.start(self._on_frame)
-        while 1:
-            if self._latest_frame is not None:
-                self._process_frame(self._latest_frame.copy())
-            else:
-                time.sleep(SLEEP_INTERVAL)
+    @property
+    def window_name(self) -> str:
+        return f"frame: {self.id}" if self.id else "frame"
 
-    def _on_frame(self, frame: MatLike) -> None:
-        self._latest_frame = frame
 
-    def _process_frame(self, frame: MatLike) -> None:
-        faces = self._face_detector.detect(frame)
-        for face in faces:
-            x, y, w, h, _ = face
-            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+class App:
+    def __init__(
+        self,
+        streams: Mapping[str, StreamEndpoints],
+        *,
+        face_redetect_interval: int = 10,
+        max_batch_size: int = 8,
+        pipeline_workers: int = 0,
+        pipeline_max_in_flight: int = 8,
+        headless: bool = False,
+        overlay_max_fps: float = 5.0,
+    ) -> None:
+        """
+        Args:
+            streams (Mapping[str, StreamEndpoints]): The frame streams to process, keyed by stream id.
+            face_redetect_interval (int, optional): The maximum number of frames between two face detections of a stream.
+            max_batch_size (int, optional): The maximum number of frames passed into the face detector at once.
+            pipeline_workers (int, optional): The number of processes of each of the face detection and facial landmarks detection stages. If `0`, the frames are processed in this thread.
+            pipeline_max_in_flight (int, optional): The maximum number of frames in the pipeline at once.
+            headless (bool, optional): If `True`, no window is shown and overlays are drawn only when they are published.
+            overlay_max_fps (float, optional): The maximum rate of the overlay frames published on the overlay publisher of each stream.
+        """
+        self._face_detector = FaceDetector(FACE_DETECTOR_MODEL_PATH, FACE_DETECTOR_CONFIG_PATH)
+        self._facial_landmarks_detector = FacialLandmarksDetector(FACIAL_LANDMARKS_MODEL_PATH)
+        self._max_batch_size = max_batch_size
+        self._headless = headless
+        self._overlay_interval = 1 / overlay_max_fps
+
+        self._pipeline: Pipeline | None = None
+        if pipeline_workers > 0:
+            self._pipeline = Pipeline(
+                num_detector_workers=pipeline_workers,
+                num_landmarks_workers=pipeline_workers,
+                max_in_flight=pipeline_max_in_flight,
+            )
+
+        self._frame_condition = Condition()
+        self._streams = {
+            stream_id: _Stream(
+                stream_id,
+                endpoints,
+                self._frame_condition,
+                face_redetect_interval=face_redetect_interval,
+            )
+            for stream_id, endpoints in streams.items()
+        }
 
+    @property
+    def stats(self) -> dict[str, FrameStats]:
+        """Get the frame counters of each stream."""
+        return {stream_id: stream.frame_slot.stats for stream_id, stream in self._streams.items()}
+
+    def run(self) -> None:
+        for stream in self._streams.values():
+            stream.frame_subscriber.start(stream.frame_slot.put)
+        if self._pipeline:
+            self._pipeline.start(self._on_pipeline_result)
+
+        try:
+            while 1:
+                with self._frame_condition:
+                    if not self._frame_condition.wait_for(self._is_ready, timeout=WAIT_TIMEOUT):
+                        continue
+                    frames = {
+                        stream: taken[1]
+                        for stream in self._streams.values()
+                        if (taken := stream.frame_slot.take()) is not None
+                    }
+
+                if self._pipeline:
+                    for stream, frame in frames.items():
+                        if not self._pipeline.submit(stream.id, frame):
+                            stream.frame_slot.count_dropped()
+                else:
+                    self._process_frames(frames)
+        finally:
+            if self._pipeline:
+                self._pipeline.close()
+
+    def _is_ready(self) -> bool:
+        if self._pipeline and not self._pipeline.has_capacity():
+            return False
+        return any(stream.frame_slot.has_frame() for stream in self._streams.values())
+
+    def _process_frames(self, frames: dict[_Stream, MatLike]) -> None:
+        detections = self._detect_faces(
+            {
+                stream: frame
+                for stream, frame in frames.items()
+                if stream.face_tracker.needs_detection()
+            }
+        )
+        for stream, frame in frames.items():
+            if stream in detections:
+                faces = stream.face_tracker.set_detections(detections[stream])
+            else:
+                faces = stream.face_tracker.track()
+            self._process_frame(stream, frame, faces)
+
+    def _detect_faces(self, frames: dict[_Stream, MatLike]) -> dict[_Stream, list[Face]]:
+        streams = list(frames)
+        detections: dict[_Stream, list[Face]] = {}
+        for i in range(0, len(streams), self._max_batch_size):
+            batch = streams[i : i + self._max_batch_size]
+            faces = self._face_detector.detect_batch([frames[stream] for stream in batch])
+            detections.update(zip(batch, faces))
+        return detections
+
+    def _process_frame(self, stream: _Stream, frame: MatLike, faces: list[Face]) -> None:
+        analysis = FrameAnalysis(faces)
         if faces:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
             max_conf_face = max(faces, key=lambda x: x.confidence)
             landmarks = self._facial_landmarks_detector.detect(gray, max_conf_face)
+            stream.face_tracker.update_landmarks(landmarks, frame.shape[:2])
 
-            for x, y in landmarks:
-                cv2.circle(frame, (x, y), 1, (0, 0, 255), -1)
-
-            if not self._head_pose_estimator.is_image_size_set():
-                self._head_pose_estimator.set_image_size(*frame.shape[:2])
-            pose = self._head_pose_estimator.estimate(landmarks)
-
-            both_ear = BothEyeAspectRatio(
-                left=self.calc_ear(landmarks.left_eye), right=self.calc_ear(landmarks.right_eye)
+            analysis = analyze_landmarks(
+                faces, landmarks, stream.head_pose_estimator, frame.shape[:2]
             )
 
-            nose_tip_2d = landmarks[30]
-            pose_2d = self.project_pose(pose)
-            end_point = (nose_tip_2d + np.array(pose_2d) * 20).astype(int)
-            cv2.arrowedLine(frame, tuple(nose_tip_2d), end_point, (0, 0, 255), 2)
-
-            self._analysis_msg_publisher.publish(
-                AnalysisMsg(
-                    timestamp=datetime.now(),
-                    is_absent=False,
-                    both_eye_aspect_ratio=both_ear,
-                    head_direction=pose.to_direction(),
-                )
-            )
+        self._handle_analysis(stream, frame, analysis)
+
+    def _on_pipeline_result(
+        self, stream_id: str, frame: MatLike, analysis: FrameAnalysis | None
+    ) -> None:
+        stream = self._streams[stream_id]
+        if analysis is None:
+            stream.frame_slot.count_dropped()
         else:
-            self._analysis_msg_publisher.publish(
-                AnalysisMsg(
-                    timestamp=datetime.now(),
-                    is_absent=True,
-                    both_eye_aspect_ratio=None,
-                    head_direction=None,
-                )
-            )
+            self._handle_analysis(stream, frame, analysis)
+        # The pipeline may have room for the next frame now.
+        with self._frame_condition:
+            self._frame_condition.notify_all()
+
+    def _handle_analysis(self, stream: _Stream, frame: MatLike, analysis: FrameAnalysis) -> None:
+        stream.analysis_msg_publisher.publish(analysis.to_analysis_msg(datetime.now()))
+        stream.frame_slot.count_processed()
 
         curr_time = time.time()
-        elapsed_time = curr_time - self._prev_time
+        elapsed_time = curr_time - stream.prev_time
         if elapsed_time > 0:
-            self._fps = 1 / elapsed_time
-        self._prev_time = curr_time
-        cv2.putText(
-            frame, f"FPS: {self._fps:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2
+            stream.fps = 1 / elapsed_time
+        stream.prev_time = curr_time
+
+        is_overlay_due = (
+            stream.overlay_publisher is not None
+            and curr_time - stream.last_overlay_time >= self._overlay_interval
         )
+        if self._headless and not is_overlay_due:
+            return
 
-        cv2.imshow("frame", frame)
-        cv2.waitKey(1)
+        overlay = self._draw_overlay(stream, frame, analysis)
+        if is_overlay_due and stream.overlay_publisher:
+            stream.overlay_publisher.publish(overlay)
+            stream.last_overlay_time = curr_time
+        if not self._headless:
+            cv2.imshow(stream.window_name, overlay)
+            cv2.waitKey(1)
 
     @staticmethod
-    def project_pose(pose: HeadPose) -> tuple[float, float]:
-        x, y = np.sin(np.radians(pose.yaw)), -np.sin(np.radians(pose.pitch))
-        norm = np.linalg.norm((x, y))
-        return (float(x / norm), float(y / norm))
+    def _draw_overlay(stream: _Stream, frame: MatLike, analysis: FrameAnalysis) -> MatLike:
+        overlay = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR) if frame.ndim == 2 else frame.copy()
+        for face in analysis.faces:
+            x, y, w, h, _ = face
+            cv2.rectangle(overlay, (x, y), (x + w, y + h), (0, 255, 0), 2)
 
-    @staticmethod
-    def calc_ear(eye_landmarks: np.ndarray) -> float:
-        dist_p2_p6 = distance.euclidean(eye_landmarks[1], eye_landmarks[5])
-        dist_p3_p5 = distance.euclidean(eye_landmarks[2], eye_landmarks[4])
-        dist_p1_p4 = distance.euclidean(eye_landmarks[0], eye_landmarks[3])
-        return float((dist_p2_p6 + dist_p3_p5) / (2.0 * dist_p1_p4))
+        if analysis.landmarks is not None and analysis.pose is not None:
+            for x, y in analysis.landmarks:
+                cv2.circle(overlay, (x, y), 1, (0, 0, 255), -1)
+
+            nose_tip_2d = analysis.landmarks[30]
+            pose_2d = project_pose(analysis.pose)
+            end_point = (nose_tip_2d + np.array(pose_2d) * 20).astype(int)
+            cv2.arrowedLine(overlay, tuple(nose_tip_2d), end_point, (0, 0, 255), 2)
+
+        cv2.putText(
+            overlay, f"FPS: {stream.fps:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2
+        )
+        received, processed, dropped = stream.frame_slot.stats
+        cv2.putText(
+            overlay,
+            f"recv: {received} proc: {processed} drop: {dropped}",
+            (10, 60),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.6,
+            (255, 0, 0),
+            2,
+        )
+        return overlay
@@ -5,3 +5,10 @@ APP_ROOT: Final[str] = os.path.dirname(os.path.abspath(__file__))
 MODELS_DIR: Final[str] = os.path.join(APP_ROOT, "models")
 
 LANDMARKS_NUM: Final[int] = 68
+
+FACE_DETECTOR_MODEL_PATH: Final[str] = os.path.join(MODELS_DIR, "opencv_face_detector_uint8.pb")
+FACE_DETECTOR_CONFIG_PATH: Final[str] = os.path.join(MODELS_DIR, "opencv_face_detector.pbtxt")
+FACIAL_LANDMARKS_MODEL_PATH: Final[str] = os.path.join(
+    MODELS_DIR, "shape_predictor_68_face_landmarks_GTX.dat"
+)
+FACIAL_LANDMARKS_3D_PATH: Final[str] = os.path.join(MODELS_DIR, "facial_landmarks_3d.csv")
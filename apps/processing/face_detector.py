@@ -1,3 +1,5 @@
+from typing import Sequence
+
 import cv2
 
 from libs.types import MatLike
@@ -23,6 +25,7 @@ class FaceDetector:
         """
         self._net = cv2.dnn.readNet(model_path, config_path)
         self._confidence_threshold = confidence_threshold
+        self._supports_batch = True
 
     def detect(self, image: MatLike) -> list[Face]:
         """Detect faces in the provided image.
@@ -36,20 +39,53 @@ class FaceDetector:
         Returns:
             list[Face]: A list of detected faces.
         """
-        height, width = image.shape[:2]
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images: Sequence[MatLike]) -> list[list[Face]]:
+        """Detect faces in the provided images with a single forward pass.
+
+        If the model does not accept a batch of images, e.g. the bundled TensorFlow SSD,
+        this falls back to one forward pass per image.
 
-        inputBlob = cv2.dnn.blobFromImage(
-            cv2.resize(image, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0), True, False
+        Args:
+            images (Sequence[MatLike]): The OpenCV images, which may have different sizes.
+
+        Returns:
+            list[list[Face]]: A list of detected faces for each image, in the same order as `images`.
+        """
+        if len(images) > 1 and self._supports_batch:
+            try:
+                return self._to_faces(self._forward(images), images)
+            except cv2.error:
+                self._supports_batch = False
+
+        return [self._to_faces(self._forward([image]), [image])[0] for image in images]
+
+    def _forward(self, images: Sequence[MatLike]) -> MatLike:
+        inputBlob = cv2.dnn.blobFromImages(
+            [_to_bgr(cv2.resize(image, (300, 300))) for image in images],
+            1.0,
+            (300, 300),
+            (104.0, 177.0, 123.0),
+            True,
+            False,
         )
         self._net.setInput(inputBlob)
-        detections = self._net.forward()
+        return self._net.forward()
 
-        faces: list[Face] = []
+    def _to_faces(self, detections: MatLike, images: Sequence[MatLike]) -> list[list[Face]]:
+        faces: list[list[Face]] = [[] for _ in images]
         for i in range(detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
-            if confidence > self._confidence_threshold:
+            image_id, _, confidence = detections[0, 0, i, :3]
+            if image_id >= 0 and confidence > self._confidence_threshold:
+                height, width = images[int(image_id)].shape[:2]
                 box = detections[0, 0, i, 3:7] * [width, height, width, height]
                 (x, y, x2, y2) = box.astype("int")
-                faces.append(Face(x, y, x2 - x, y2 - y, confidence))
+                faces[int(image_id)].append(Face(x, y, x2 - x, y2 - y, confidence))
 
         return faces
+
+
+def _to_bgr(image: MatLike) -> MatLike:
+    # Frames may be sent in grayscale, while the network expects 3 channels.
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR) if image.ndim == 2 else image
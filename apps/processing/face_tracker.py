@@ -0,0 +1,111 @@
+import numpy as np
+
+from .schemas import Face, FacialLandmarks2d
+
+
+class FaceTracker:
+    """Face tracker that tells when the face detector must run, e.g. when the tracked face is lost.
+
+    The face box of the next frame is taken from the extent of the facial landmarks of the
+    current frame. The detector must run again every `redetect_interval` frames,
+    when the landmarks box drifts too far from the previous box, or when the box leaves the frame.
+    """
+
+    def __init__(
+        self,
+        *,
+        redetect_interval: int = 10,
+        min_iou: float = 0.5,
+        margin_ratio: float = 0.15,
+    ) -> None:
+        """
+        Args:
+            redetect_interval (int, optional): The maximum number of frames between two detections. If `1`, the detector runs on every frame.
+            min_iou (float, optional): The minimum IoU between the landmarks boxes of successive frames to keep tracking.
+            margin_ratio (float, optional): The margin added around the landmarks extent, relative to its size.
+        """
+        if redetect_interval < 1:
+            raise ValueError("redetect_interval must be greater than or equal to 1")
+
+        self._redetect_interval = redetect_interval
+        self._min_iou = min_iou
+        self._margin_ratio = margin_ratio
+
+        self._tracked_face: Face | None = None
+        self._landmarks_face: Face | None = None
+        self._frames_since_detection = 0
+
+    def track(self) -> list[Face]:
+        """Get the tracked face without running the detector.
+
+        Returns:
+            list[Face]: A list containing the tracked face, or an empty list if no face is tracked.
+        """
+        self._frames_since_detection += 1
+        return [self._tracked_face] if self._tracked_face else []
+
+    def needs_detection(self) -> bool:
+        """Check whether the detector must run on the next frame."""
+        return (
+            self._tracked_face is None
+            or self._frames_since_detection + 1 >= self._redetect_interval
+        )
+
+    def set_detections(self, faces: list[Face]) -> list[Face]:
+        """Set the faces detected on the current frame by the detector.
+
+        Args:
+            faces (list[Face]): The detected faces.
+
+        Returns:
+            list[Face]: The given faces.
+        """
+        self._frames_since_detection = 0
+        self._tracked_face = max(faces, key=lambda x: x.confidence) if faces else None
+        self._landmarks_face = None
+        return faces
+
+    def update_landmarks(self, landmarks: FacialLandmarks2d, image_size: tuple[int, int]) -> None:
+        """Update the tracked face from the landmarks detected on the current frame.
+
+        Args:
+            landmarks (FacialLandmarks2d): The facial landmarks of the tracked face.
+            image_size (tuple[int, int]): The height and width of the image.
+        """
+        if self._tracked_face is None:
+            return
+
+        height, width = image_size
+        (x, y), (x2, y2) = np.min(landmarks, axis=0), np.max(landmarks, axis=0)
+        margin_x, margin_y = (x2 - x) * self._margin_ratio, (y2 - y) * self._margin_ratio
+        x, y = int(x - margin_x), int(y - margin_y)
+        x2, y2 = int(x2 + margin_x), int(y2 + margin_y)
+
+        if x < 0 or y < 0 or x2 > width or y2 > height:
+            self.reset()
+            return
+
+        face = Face(x, y, x2 - x, y2 - y, self._tracked_face.confidence)
+        # The detector box and the landmarks box have different shapes,
+        # so only successive landmarks boxes are compared.
+        if self._landmarks_face and self.calc_iou(face, self._landmarks_face) < self._min_iou:
+            self.reset()
+            return
+
+        self._tracked_face = face
+        self._landmarks_face = face
+
+    def reset(self) -> None:
+        """Drop the tracked face so that the detector runs on the next frame."""
+        self._tracked_face = None
+        self._landmarks_face = None
+        self._frames_since_detection = 0
+
+    @staticmethod
+    def calc_iou(a: Face, b: Face) -> float:
+        inter_w = min(a.x + a.w, b.x + b.w) - max(a.x, b.x)
+        inter_h = min(a.y + a.h, b.y + b.h) - max(a.y, b.y)
+        if inter_w <= 0 or inter_h <= 0:
+            return 0.0
+        inter = inter_w * inter_h
+        return float(inter / (a.area + b.area - inter))
@@ -0,0 +1,70 @@
+from threading import Condition
+
+from libs.types import MatLike
+
+from .schemas import FrameStats
+
+
+class FrameSlot:
+    """Hold the latest frame of a stream until it is taken for processing.
+
+    Each frame is taken at most once. Frames replaced by a newer one before being taken are
+    counted as dropped. The slot notifies the given condition when a frame is put,
+    so that a single consumer can wait for the slots of several streams at once.
+    """
+
+    def __init__(self, condition: Condition) -> None:
+        """
+        Args:
+            condition (Condition): The condition to notify when a frame is put. It is also used as the lock of the slot.
+        """
+        self._condition = condition
+        self._frame: MatLike | None = None
+        self._seq = 0
+        self._taken_seq = 0
+
+        self._received = 0
+        self._processed = 0
+        self._dropped = 0
+
+    def put(self, frame: MatLike) -> None:
+        """Put a new frame, replacing the previous one if it has not been taken yet."""
+        with self._condition:
+            self._frame = frame
+            self._seq += 1
+            self._received += 1
+            self._condition.notify_all()
+
+    def take(self) -> tuple[int, MatLike] | None:
+        """Take the latest frame if it has not been taken yet.
+
+        Returns:
+            tuple[int, MatLike] | None: The sequence number and the frame, or `None` if there is no new frame.
+        """
+        with self._condition:
+            if self._frame is None:
+                return None
+
+            frame, self._frame = self._frame, None
+            self._dropped += self._seq - self._taken_seq - 1
+            self._taken_seq = self._seq
+            return self._seq, frame
+
+    def has_frame(self) -> bool:
+        """Check whether there is a frame that has not been taken yet."""
+        return self._frame is not None
+
+    def count_processed(self) -> None:
+        """Count a taken frame as processed."""
+        with self._condition:
+            self._processed += 1
+
+    def count_dropped(self) -> None:
+        """Count a taken frame as dropped."""
+        with self._condition:
+            self._dropped += 1
+
+    @property
+    def stats(self) -> FrameStats:
+        with self._condition:
+            return FrameStats(self._received, self._processed, self._dropped)
@@ -0,0 +1,273 @@
+import logging
+import multiprocessing as mp
+import queue
+from dataclasses import dataclass, field
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from threading import Lock, Thread
+from time import monotonic
+from typing import Callable
+
+import cv2
+
+from libs.types import MatLike
+
+from .analysis import analyze_landmarks
+from .constants import (
+    FACE_DETECTOR_CONFIG_PATH,
+    FACE_DETECTOR_MODEL_PATH,
+    FACIAL_LANDMARKS_3D_PATH,
+    FACIAL_LANDMARKS_MODEL_PATH,
+)
+from .face_detector import FaceDetector
+from .facial_landmarks_detector import FacialLandmarksDetector
+from .head_pose_estimator import HeadPoseEstimator
+from .schemas import Face, FacialLandmarks2d, FrameAnalysis
+
+logger = logging.getLogger(__name__)
+
+PipelineCallback = Callable[[str, MatLike, FrameAnalysis | None], None]
+
+
+@dataclass(slots=True)
+class _Job:
+    """A frame travelling through the pipeline stages."""
+
+    seq: int
+    stream_id: str
+    image: MatLike | None
+    image_size: tuple[int, int]
+    faces: list[Face] = field(default_factory=list)
+    landmarks: FacialLandmarks2d | None = None
+    analysis: FrameAnalysis | None = None
+    failed: bool = False
+
+
+_StageTarget = Callable[["Queue[_Job]", "Queue[_Job]"], None]
+
+
+class Pipeline:
+    """Run the processing stages in separate processes connected by bounded queues.
+
+    The stages are face detection, facial landmarks detection, and head pose and EAR estimation.
+    The first two stages are stateless and can have several workers each,
+    while the last one keeps a `HeadPoseEstimator` per stream and runs in a single process.
+    Frames are tagged with sequence numbers and their results are delivered in submission order.
+
+    Since the stages of successive frames overlap in time, the face is detected on every frame.
+
+    Frames failing in a stage, or whose result does not come out within the job timeout, e.g. because a stage process
+    died, are passed to the callback without a result so that the following frames are not held back.
+    Stage processes which died are restarted.
+    """
+
+    def __init__(
+        self,
+        *,
+        num_detector_workers: int = 1,
+        num_landmarks_workers: int = 1,
+        max_in_flight: int = 8,
+        job_timeout: float = 5.0,
+    ) -> None:
+        """
+        Args:
+            num_detector_workers (int, optional): The number of face detection processes.
+            num_landmarks_workers (int, optional): The number of facial landmarks detection processes.
+            max_in_flight (int, optional): The maximum number of frames in the pipeline at once. Frames submitted beyond this are rejected.
+            job_timeout (float, optional): The time (in seconds) after which a frame whose result has not come out is given up on.
+        """
+        self._max_in_flight = max_in_flight
+        self._job_timeout = job_timeout
+
+        ctx = mp.get_context("spawn")
+        self._ctx = ctx
+        self._detection_queue: Queue[_Job] = ctx.Queue(max_in_flight)
+        self._landmarks_queue: Queue[_Job] = ctx.Queue(max_in_flight)
+        self._pose_queue: Queue[_Job] = ctx.Queue(max_in_flight)
+        self._result_queue: Queue[_Job] = ctx.Queue(max_in_flight)
+
+        self._stages: list[tuple[_StageTarget, Queue[_Job], Queue[_Job]]] = [
+            *(
+                (_run_detector, self._detection_queue, self._landmarks_queue)
+                for _ in range(num_detector_workers)
+            ),
+            *(
+                (_run_landmarks_detector, self._landmarks_queue, self._pose_queue)
+                for _ in range(num_landmarks_workers)
+            ),
+            (_run_pose_estimator, self._pose_queue, self._result_queue),
+        ]
+        self._processes: list[BaseProcess] = [
+            self._create_process(i) for i in range(len(self._stages))
+        ]
+
+        self._lock = Lock()
+        self._is_running = False
+        self._thread: Thread | None = None
+        self._next_seq = 0
+        self._frames: dict[int, tuple[str, MatLike, float]] = {}
+
+    def start(self, callback: PipelineCallback) -> None:
+        """Start the stage processes and the thread delivering results.
+
+        Args:
+            callback (PipelineCallback): Function to call with the stream id, the frame and its analysis result, in submission order. The result is `None` if the frame failed.
+
+        Raises:
+            RuntimeError: If the pipeline is already running.
+        """
+        if self._is_running:
+            raise RuntimeError("Pipeline is already running")
+
+        self._is_running = True
+        for process in self._processes:
+            process.start()
+        self._thread = Thread(target=self._collect, args=(callback,), daemon=True)
+        self._thread.start()
+
+    def submit(self, stream_id: str, frame: MatLike) -> bool:
+        """Submit a frame to the pipeline without blocking.
+
+        Args:
+            stream_id (str): The stream id of the frame.
+            frame (MatLike): The frame to process. It must not be modified until it is passed to the callback.
+
+        Returns:
+            bool: `True` if the frame was accepted, `False` if the pipeline is full.
+        """
+        with self._lock:
+            if len(self._frames) >= self._max_in_flight:
+                return False
+            seq = self._next_seq
+            self._next_seq += 1
+            self._frames[seq] = (stream_id, frame, monotonic())
+
+        self._detection_queue.put(_Job(seq, stream_id, frame, frame.shape[:2]))
+        return True
+
+    def has_capacity(self) -> bool:
+        """Check whether a frame submitted now would be accepted."""
+        with self._lock:
+            return len(self._frames) < self._max_in_flight
+
+    def close(self) -> None:
+        """Stop the thread delivering results, terminate the stage processes and close the queues."""
+        self._is_running = False
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for q in (
+            self._detection_queue,
+            self._landmarks_queue,
+            self._pose_queue,
+            self._result_queue,
+        ):
+            # Nothing reads the queues anymore, so the data left in them is not flushed.
+            q.close()
+            q.cancel_join_thread()
+
+    def _collect(self, callback: PipelineCallback) -> None:
+        next_seq = 0
+        pending: dict[int, _Job] = {}
+        while self._is_running:
+            self._restart_dead_processes()
+            try:
+                job = self._result_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+            else:
+                # The result of a frame given up on may still come out of a slow stage.
+                if job.seq >= next_seq:
+                    pending[job.seq] = job
+
+            while True:
+                analysis: FrameAnalysis | None = None
+                if next_seq in pending:
+                    job = pending.pop(next_seq)
+                    if not job.failed:
+                        analysis = job.analysis
+                elif not self._is_expired(next_seq):
+                    break
+                with self._lock:
+                    stream_id, frame, _ = self._frames.pop(next_seq)
+                next_seq += 1
+                callback(stream_id, frame, analysis)
+
+    def _is_expired(self, seq: int) -> bool:
+        with self._lock:
+            entry = self._frames.get(seq)
+        return entry is not None and monotonic() - entry[2] > self._job_timeout
+
+    def _create_process(self, stage: int) -> BaseProcess:
+        target, in_queue, out_queue = self._stages[stage]
+        return self._ctx.Process(target=target, args=(in_queue, out_queue), daemon=True)
+
+    def _restart_dead_processes(self) -> None:
+        for i, process in enumerate(self._processes):
+            if not process.is_alive():
+                # The frames held by the process are lost, and given up on when they expire.
+                logger.warning(
+                    "Restarting pipeline process %s which exited with code %s",
+                    process.name,
+                    process.exitcode,
+                )
+                self._processes[i] = self._create_process(i)
+                self._processes[i].start()
+
+
+def _run_detector(in_queue: "Queue[_Job]", out_queue: "Queue[_Job]") -> None:
+    face_detector = FaceDetector(FACE_DETECTOR_MODEL_PATH, FACE_DETECTOR_CONFIG_PATH)
+    while True:
+        job = in_queue.get()
+        if not job.failed and job.image is not None:
+            try:
+                job.faces = face_detector.detect(job.image)
+                # Only the grayscale image is needed by the following stages.
+                if not job.faces:
+                    job.image = None
+                elif job.image.ndim == 3:
+                    job.image = cv2.cvtColor(job.image, cv2.COLOR_BGR2GRAY)
+            except Exception:
+                job.failed = True
+        out_queue.put(job)
+
+
+def _run_landmarks_detector(in_queue: "Queue[_Job]", out_queue: "Queue[_Job]") -> None:
+    facial_landmarks_detector = FacialLandmarksDetector(FACIAL_LANDMARKS_MODEL_PATH)
+    while True:
+        job = in_queue.get()
+        if not job.failed and job.faces and job.image is not None:
+            try:
+                max_conf_face = max(job.faces, key=lambda x: x.confidence)
+                job.landmarks = facial_landmarks_detector.detect(job.image, max_conf_face)
+            except Exception:
+                job.failed = True
+        job.image = None
+        out_queue.put(job)
+
+
+def _run_pose_estimator(in_queue: "Queue[_Job]", out_queue: "Queue[_Job]") -> None:
+    head_pose_estimators: dict[str, HeadPoseEstimator] = {}
+    while True:
+        job = in_queue.get()
+        if not job.failed:
+            try:
+                if job.landmarks is None:
+                    job.analysis = FrameAnalysis(job.faces)
+                else:
+                    if job.stream_id not in head_pose_estimators:
+                        head_pose_estimators[job.stream_id] = HeadPoseEstimator(
+                            FACIAL_LANDMARKS_3D_PATH
+                        )
+                    job.analysis = analyze_landmarks(
+                        job.faces,
+                        job.landmarks,
+                        head_pose_estimators[job.stream_id],
+                        job.image_size,
+                    )
+            except Exception:
+                job.failed = True
+        out_queue.put(job)
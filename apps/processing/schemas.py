@@ -1,13 +1,44 @@
+from datetime import datetime
 from typing import Final, NamedTuple
 
 import numpy as np
 import numpy.typing as npt
 
-from libs.schemas.analysis_msg import HeadDirection
+from libs.ipc import BasePublisher, BaseSubscriber
+from libs.schemas.analysis_msg import AnalysisMsg, BothEyeAspectRatio, HeadDirection
+from libs.types import MatLike
 
 from .constants import LANDMARKS_NUM
 
 
+class StreamEndpoints(NamedTuple):
+    """Represent the communication channels of a frame stream.
+
+    Attributes:
+        frame_subscriber (BaseSubscriber[MatLike]): The subscriber receiving the frames of the stream.
+        analysis_msg_publisher (BasePublisher[AnalysisMsg]): The publisher sending the analysis results of the stream.
+        overlay_publisher (BasePublisher[MatLike] | None): The publisher sending the frames annotated with the analysis results. If None, the overlay frames are not published.
+    """
+
+    frame_subscriber: BaseSubscriber[MatLike]
+    analysis_msg_publisher: BasePublisher[AnalysisMsg]
+    overlay_publisher: BasePublisher[MatLike] | None = None
+
+
+class FrameStats(NamedTuple):
+    """Represent the frame counters of a stream.
+
+    Attributes:
+        received (int): The number of frames received from the subscriber.
+        processed (int): The number of frames whose analysis result was published.
+        dropped (int): The number of frames replaced by a newer frame, or rejected by the pipeline, before being processed.
+    """
+
+    received: int
+    processed: int
+    dropped: int
+
+
 class Face(NamedTuple):
     """Represent a detected face.
 
@@ -110,3 +141,34 @@ class FacialLandmarks3d(BaseFacialLandmarks, np.ndarray):
             raise ValueError(f"Expected shape {cls._EXPECTED_SHAPE}, got {obj.shape}")
 
         return obj
+
+
+class FrameAnalysis(NamedTuple):
+    """Represent the analysis result of a frame.
+
+    Attributes:
+        faces (list[Face]): The detected faces.
+        landmarks (FacialLandmarks2d | None): The facial landmarks of the most confident face. If no face is detected, this field is None.
+        pose (HeadPose | None): The head pose of the most confident face. If no face is detected, this field is None.
+        both_eye_aspect_ratio (BothEyeAspectRatio | None): The eye aspect ratio of the most confident face. If no face is detected, this field is None.
+    """
+
+    faces: list[Face]
+    landmarks: FacialLandmarks2d | None = None
+    pose: HeadPose | None = None
+    both_eye_aspect_ratio: BothEyeAspectRatio | None = None
+
+    def to_analysis_msg(self, timestamp: datetime) -> AnalysisMsg:
+        if self.pose is None or self.both_eye_aspect_ratio is None:
+            return AnalysisMsg(
+                timestamp=timestamp,
+                is_absent=True,
+                both_eye_aspect_ratio=None,
+                head_direction=None,
+            )
+        return AnalysisMsg(
+            timestamp=timestamp,
+            is_absent=False,
+            both_eye_aspect_ratio=self.both_eye_aspect_ratio,
+            head_direction=self.pose.to_direction(),
+        )
@@ -0,0 +1,143 @@
+import math
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TypeVar
+
+from libs.schemas.monitor_msg import ConcentrationStatus, PenaltyFactor
+
+from .schemas import AggregatedConcentrationStatusBase
+
+Record = TypeVar("Record", bound=AggregatedConcentrationStatusBase)
+
+
+@dataclass(slots=True)
+class WindowAccumulator:
+    """Accumulate the statistics of the concentration status within a window in constant memory.
+
+    The time-weighted mean holds each score until the next one, and the last one until the window closes.
+    Accumulators of consecutive windows can be merged into the accumulator of the window covering them.
+    """
+
+    count: int = 0
+    score_sum: float = 0.0
+    score_sq_sum: float = 0.0
+    min_score: float = math.inf
+    max_score: float = -math.inf
+    absent_count: int = 0
+    drowsy_count: int = 0
+    looking_away_count: int = 0
+    weighted_score_sum: float = 0.0
+    weighted_seconds: float = 0.0
+    last_timestamp: datetime | None = None
+    last_score: float = 0.0
+
+    def add(self, timestamp: datetime, status: ConcentrationStatus) -> None:
+        score = status.overall_score
+        self.count += 1
+        self.score_sum += score
+        self.score_sq_sum += score * score
+        self.min_score = min(self.min_score, score)
+        self.max_score = max(self.max_score, score)
+
+        if status.penalty_factor & PenaltyFactor.IS_ABSENT:
+            self.absent_count += 1
+        if status.penalty_factor & PenaltyFactor.IS_DROWSY:
+            self.drowsy_count += 1
+        if status.penalty_factor & PenaltyFactor.IS_LOOKING_AWAY:
+            self.looking_away_count += 1
+
+        self._hold_last_score(until=timestamp)
+        self.last_timestamp = timestamp
+        self.last_score = score
+
+    def merge(self, other: "WindowAccumulator") -> None:
+        """Add the statistics of a closed window within the window of this accumulator."""
+        self.count += other.count
+        self.score_sum += other.score_sum
+        self.score_sq_sum += other.score_sq_sum
+        self.min_score = min(self.min_score, other.min_score)
+        self.max_score = max(self.max_score, other.max_score)
+        self.absent_count += other.absent_count
+        self.drowsy_count += other.drowsy_count
+        self.looking_away_count += other.looking_away_count
+        self.weighted_score_sum += other.weighted_score_sum
+        self.weighted_seconds += other.weighted_seconds
+
+    @classmethod
+    def from_record(cls, record: AggregatedConcentrationStatusBase) -> "WindowAccumulator":
+        """Restore the accumulator of a saved window, so that saved windows can be merged.
+
+        Records saved before the statistics were stored count as a single sample of their mean score.
+        """
+        count = record.sample_count or 1
+        mean = record.overall_score
+        seconds = (record.end_time - record.start_time).total_seconds()
+        time_weighted_score = (
+            record.time_weighted_score if record.time_weighted_score is not None else mean
+        )
+        return cls(
+            count=count,
+            score_sum=mean * count,
+            score_sq_sum=(record.score_std**2 + mean**2) * count,
+            min_score=record.min_score if record.min_score is not None else mean,
+            max_score=record.max_score if record.max_score is not None else mean,
+            absent_count=record.absent_count,
+            drowsy_count=record.drowsy_count,
+            looking_away_count=record.looking_away_count,
+            weighted_score_sum=time_weighted_score * seconds,
+            weighted_seconds=seconds,
+        )
+
+    @property
+    def mean(self) -> float:
+        return self.score_sum / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        if not self.count:
+            return 0.0
+        return math.sqrt(max(self.score_sq_sum / self.count - self.mean**2, 0.0))
+
+    @property
+    def time_weighted_mean(self) -> float:
+        if self.weighted_seconds <= 0:
+            return self.mean
+        return self.weighted_score_sum / self.weighted_seconds
+
+    def to_record(
+        self, model: type[Record], user_id: str, start_time: datetime, end_time: datetime
+    ) -> Record:
+        """Close the window and create the record to save.
+
+        Args:
+            model (type[Record]): The model of the record, which depends on the resolution.
+            user_id (str): The id of the user of the window.
+            start_time (datetime): The start time of the window.
+            end_time (datetime): The end time of the window, until which the last score is held.
+
+        Returns:
+            Record: The record of the window.
+        """
+        self._hold_last_score(until=end_time)
+        return model(
+            user_id=user_id,
+            start_time=start_time,
+            end_time=end_time,
+            overall_score=self.mean,
+            sample_count=self.count,
+            min_score=self.min_score if self.count else None,
+            max_score=self.max_score if self.count else None,
+            score_std=self.std,
+            time_weighted_score=self.time_weighted_mean,
+            absent_count=self.absent_count,
+            drowsy_count=self.drowsy_count,
+            looking_away_count=self.looking_away_count,
+        )
+
+    def _hold_last_score(self, *, until: datetime) -> None:
+        if self.last_timestamp is None:
+            return
+        seconds = max((until - self.last_timestamp).total_seconds(), 0.0)
+        self.weighted_score_sum += self.last_score * seconds
+        self.weighted_seconds += seconds
+        self.last_timestamp = until
@@ -1,53 +1,57 @@
-from collections import deque
-from dataclasses import dataclass
-from datetime import datetime, timedelta
-from itertools import islice
+from dataclasses import dataclass, field
+from datetime import datetime
 from threading import Thread
-from typing import Callable, ContextManager, Deque, Sequence
+from typing import Callable, ContextManager
 
 from sqlmodel import Session
 
 from libs.schemas.monitor_msg import ConcentrationStatus
 
-from .schemas import AggregatedConcentrationStatus
-from .store import IncomingDataStore
+from .accumulator import WindowAccumulator
+from .database import BatchWriter
+from .rollup import Resolution, select_rollups
+from .schemas import AggregatedConcentrationStatusBase
+from .store import IncomingDataStore, SequencedMonitorMsg
 
 
-@dataclass(slots=True, frozen=True)
-class TimestampedConcentrationStatus:
-    timestamp: datetime
-    status: ConcentrationStatus
+@dataclass(slots=True)
+class _Window:
+    start_time: datetime
+    end_time: datetime
+    accumulator: WindowAccumulator = field(default_factory=WindowAccumulator)
 
 
 class PeriodicAggregator:
-    """Aggregate concentration status data periodically and saves to DB."""
+    """Aggregate concentration status data periodically and saves to DB.
 
-    _INTERVAL_MINUTES = 5
-    _INTERVAL_SECONDS = _INTERVAL_MINUTES * 60
+    Data is aggregated into windows of every `Resolution` for each user.
+    Only the finest windows accumulate the incoming data, and each closed window is merged into the coarser one covering it,
+    so that all resolutions are kept up to date incrementally. The coarser windows open when a user is first seen
+    are restored from the finer windows already saved within them, e.g. before a restart.
+    All users are aggregated by a single thread.
+    """
 
     def __init__(
         self,
         store: IncomingDataStore,
+        writer: BatchWriter,
         session_context_getter: Callable[[], ContextManager[Session]],
     ) -> None:
         """
         Args:
             store (IncomingDataStore): Store to get the latest concentration status data.
-            session_context_getter (Callable[[], ContextManager[Session]]): Callable that returns a context manager for a session.
+            writer (BatchWriter): Writer to save the aggregated data to DB.
+            session_context_getter (Callable[[], ContextManager[Session]]): Callable that returns a context manager for a session to read the saved data.
         """
         self._store = store
+        self._writer = writer
         self._session_context_getter = session_context_getter
 
         self._is_running = False
         self._thread: Thread | None = None
 
-        now = datetime.now()
-        self._last_aggregated_time = now.replace(
-            minute=(now.minute // self._INTERVAL_MINUTES) * self._INTERVAL_MINUTES,
-            second=0,
-            microsecond=0,
-        )
-        self._buffer: Deque[TimestampedConcentrationStatus] = deque()
+        self._resolutions = list(Resolution)
+        self._windows: dict[str, list[_Window]] = {}
 
     def start(self) -> None:
         """Begin the aggregation process.
@@ -64,74 +68,102 @@ class PeriodicAggregator:
         self._thread.start()
 
     def _run(self) -> None:
+        # Messages are consumed from a cursor, so none is missed while a window is being saved.
+        cursor = self._store.latest_seq
         while self._is_running:
-            is_timed_out = not self._store.wait_for_change(timeout=self._INTERVAL_SECONDS)
-            if self._store.latest_monitor_msg is None or not isinstance(
-                self._store.latest_monitor_msg.payload, ConcentrationStatus
-            ):
-                continue
-
-            if not is_timed_out:
-                self._buffer.append(
-                    TimestampedConcentrationStatus(
-                        timestamp=self._store.latest_monitor_msg.timestamp,
-                        status=self._store.latest_monitor_msg.payload,
-                    )
-                )
-            if is_timed_out or self._has_elapsed_interval():
-                exclude_latest = not is_timed_out
-                end_time = self._last_aggregated_time + timedelta(seconds=self._INTERVAL_SECONDS)
-
-                with self._session_context_getter() as session:
-                    target = (
-                        list(islice(self._buffer, 0, len(self._buffer) - 1))
-                        if exclude_latest
-                        else self._buffer
-                    )
-                    self._aggregate(
-                        target,
-                        self._last_aggregated_time,
-                        end_time,
-                        session,
-                    )
-
-                self._last_aggregated_time = end_time
-                self._clear_buffer(exclude_latest=exclude_latest)
-
-    def _has_elapsed_interval(self) -> bool:
-        if not self._buffer:
-            return False
-
-        elapsed = self._buffer[-1].timestamp - self._last_aggregated_time
-        return elapsed.total_seconds() >= self._INTERVAL_SECONDS
-
-    def _clear_buffer(self, *, exclude_latest: bool = False) -> None:
-        if not self._buffer:
-            return
-
-        if exclude_latest:
-            latest = self._buffer.pop()
-            self._buffer.clear()
-            self._buffer.append(latest)
-        else:
-            self._buffer.clear()
+            now = datetime.now()
+            finest = self._resolutions[0]
+            timeout = ((finest.floor(now) + finest.interval) - now).total_seconds()
+
+            records: list[AggregatedConcentrationStatusBase] = []
+            cursor = self._aggregate(self._store.wait_for(cursor, timeout=timeout), cursor, records)
+            now = datetime.now()
+            # The messages received before now are aggregated before their windows are closed by now.
+            cursor = self._aggregate(self._store.wait_for(cursor, timeout=0), cursor, records)
+            for user_id, windows in self._windows.items():
+                self._close_windows(user_id, windows, until=now, records=records)
+            self._writer.write(records)
 
-    @staticmethod
     def _aggregate(
-        data: Sequence[TimestampedConcentrationStatus],
-        start_time: datetime,
-        end_time: datetime,
-        session: Session,
-    ) -> None:
-        if not data:
-            return
+        self,
+        items: list[SequencedMonitorMsg],
+        cursor: int,
+        records: list[AggregatedConcentrationStatusBase],
+    ) -> int:
+        """Add messages to the windows of their users, and return the cursor after them."""
+        for item in items:
+            cursor = item.seq
+            if isinstance(item.msg.payload, ConcentrationStatus):
+                # Messages are assigned by the time they were received rather than by their timestamps,
+                # which come from the clocks of the local apps, so that they are in the windows closed by
+                # the clock of the server even when they are late.
+                windows = self._get_windows(item.user_id, item.received_time)
+                self._close_windows(
+                    item.user_id, windows, until=item.received_time, records=records
+                )
+                windows[0].accumulator.add(item.received_time, item.msg.payload)
+        return cursor
+
+    def _get_windows(self, user_id: str, time: datetime) -> list[_Window]:
+        windows = self._windows.get(user_id)
+        if windows is None:
+            windows = [self._create_window(resolution, time) for resolution in self._resolutions]
+            self._restore_windows(user_id, windows)
+            self._windows[user_id] = windows
+        return windows
+
+    def _restore_windows(self, user_id: str, windows: list[_Window]) -> None:
+        """Merge the finer windows saved within each coarser window of a user before it was opened.
+
+        Otherwise, the coarser windows would be saved with only the data aggregated since then.
+        """
+        with self._session_context_getter() as session:
+            for level in range(1, len(windows)):
+                # The finer windows end before the finer window currently open, which has not been saved yet.
+                statement = select_rollups(
+                    user_id,
+                    self._resolutions[level - 1],
+                    windows[level].start_time,
+                    windows[level - 1].start_time,
+                )
+                for record in session.exec(statement):
+                    windows[level].accumulator.merge(WindowAccumulator.from_record(record))
 
-        data_len = len(data)
-        overall_score = sum(status.status.overall_score for status in data) / data_len
+    def _close_windows(
+        self,
+        user_id: str,
+        windows: list[_Window],
+        *,
+        until: datetime,
+        records: list[AggregatedConcentrationStatusBase],
+    ) -> None:
+        """Collect the accumulated data of every window of a user ending at or before the given time."""
+        while windows[0].end_time <= until:
+            self._close_window(user_id, windows, 0, records)
 
-        session.add(
-            AggregatedConcentrationStatus(
-                start_time=start_time, end_time=end_time, overall_score=overall_score
+    def _close_window(
+        self,
+        user_id: str,
+        windows: list[_Window],
+        level: int,
+        records: list[AggregatedConcentrationStatusBase],
+    ) -> None:
+        resolution = self._resolutions[level]
+        window = windows[level]
+        if window.accumulator.count:
+            records.append(
+                window.accumulator.to_record(
+                    resolution.model, user_id, window.start_time, window.end_time
+                )
             )
-        )
-        session.commit()
+            if level + 1 < len(windows):
+                windows[level + 1].accumulator.merge(window.accumulator)
+
+        windows[level] = self._create_window(resolution, window.end_time)
+        if level + 1 < len(windows) and windows[level + 1].end_time <= window.end_time:
+            self._close_window(user_id, windows, level + 1, records)
+
+    @staticmethod
+    def _create_window(resolution: Resolution, time: datetime) -> _Window:
+        start_time = resolution.floor(time)
+        return _Window(start_time, start_time + resolution.interval)
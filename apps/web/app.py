@@ -1,50 +1,184 @@
+import asyncio
+import os
+import sys
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from typing import AsyncIterator, Callable
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
+from sqlmodel import SQLModel
 
-from libs.ipc import BaseSubscriber
+from libs.ipc import AsyncZmqSubscriber, BaseSubscriber, StreamMsg, ZmqPublisher
 from libs.schemas.monitor_msg import ConcentrationStatus, MonitorMsg
 
 from .aggregator import PeriodicAggregator
-from .constants import STATIC_DIR
-from .database import create_db_and_tables, get_session_context
+from .constants import DEFAULT_USER_ID, STATIC_DIR
+from .database import (
+    BatchWriter,
+    create_db_and_tables,
+    get_read_session_context,
+    get_session_context,
+)
+from .live import (
+    LIVE_TOPIC,
+    LiveEvent,
+    LiveEventSerializer,
+    MonitorEvent,
+    WindowsSaved,
+    apply_live_event,
+)
 from .router import router
+from .schemas import AggregatedConcentrationStatusBase
+from .sse import to_sse_frame
 from .store import AccumalatedScoreStore, IncomingDataStore, ParameterStore
 
+# The environment variables configuring the worker processes created by `App.run`.
+LIVE_ADDR_ENV = "SOZO_WEB_LIVE_ADDR"
+EVOLUTION_THRESHOLD_ENV = "SOZO_WEB_EVOLUTION_THRESHOLD"
+
 
 class App:
     def __init__(
-        self, subscriber: BaseSubscriber[MonitorMsg], *, evolution_threshold: float = 5000
+        self,
+        subscriber: BaseSubscriber[StreamMsg[MonitorMsg]],
+        *,
+        evolution_threshold: float = 5000,
+        workers: int = 1,
+        live_addr: str | None = None,
     ):
+        """
+        Args:
+            subscriber (BaseSubscriber[StreamMsg[MonitorMsg]]): Subscriber of the monitor messages of all users, whose stream ids are the user ids. Messages without a stream id belong to the default user.
+            evolution_threshold (float, optional): The accumulated score at which the pet of a user evolves.
+            workers (int, optional): The number of processes serving the clients. If more than one, this process only receives and aggregates the messages, and publishes the live state to the worker processes.
+            live_addr (str | None, optional): The address to publish the live state to the worker processes on. Required if `workers` is more than one.
+
+        Raises:
+            ValueError: If `workers` is more than one and `live_addr` is not given.
+        """
+        if workers > 1 and live_addr is None:
+            raise ValueError("live_addr is required to run multiple workers")
+
         self._subscriber = subscriber
+        self._workers = workers
+        self._live_addr = live_addr
+        self._live_publisher: ZmqPublisher[LiveEvent] | None = None
+        self._publish_live: Callable[[LiveEvent], None] = apply_live_event
+        if workers > 1 and live_addr is not None:
+            self._live_publisher = ZmqPublisher(live_addr, LIVE_TOPIC, LiveEventSerializer())
+            self._publish_live = self._live_publisher.publish
+
         self._incoming_data_store = IncomingDataStore()
-        self._accumalated_score_store = AccumalatedScoreStore()
+        self._batch_writer = BatchWriter(get_session_context, on_commit=self._on_records_written)
         self._aggregator = PeriodicAggregator(
-            store=self._incoming_data_store, session_context_getter=get_session_context
+            store=self._incoming_data_store,
+            writer=self._batch_writer,
+            session_context_getter=get_read_session_context,
         )
 
         self._parameter_store = ParameterStore()
         self._parameter_store.evolution_threshold = evolution_threshold
 
-        self._fastapi_app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
-        self._fastapi_app.mount(
-            path="/static", app=StaticFiles(directory=STATIC_DIR), name="static"
-        )
-        self._fastapi_app.include_router(router)
+        self._fastapi_app = create_fastapi_app(self._lifespan)
 
         create_db_and_tables()
 
     def run(self, host: str, port: int, *, log_level: str | None = None) -> None:
-        self._subscriber.start(self._on_message)
+        self._batch_writer.start()
         self._aggregator.start()
-        uvicorn.run(self._fastapi_app, host=host, port=port, log_level="info")
+        if self._workers > 1:
+            asyncio.run(self._run_ingest(host, port))
+        else:
+            uvicorn.run(self._fastapi_app, host=host, port=port, log_level="info")
+
+    async def _run_ingest(self, host: str, port: int) -> None:
+        assert self._live_addr is not None and self._live_publisher is not None
+
+        self._subscriber.start(self._on_message)
+        # The workers are started by the uvicorn CLI, since its process manager must run in the main thread.
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "uvicorn",
+            f"{__name__}:create_worker_app",
+            "--factory",
+            "--host",
+            host,
+            "--port",
+            str(port),
+            "--workers",
+            str(self._workers),
+            "--log-level",
+            "info",
+            env={
+                **os.environ,
+                LIVE_ADDR_ENV: self._live_addr,
+                EVOLUTION_THRESHOLD_ENV: str(self._parameter_store.evolution_threshold),
+            },
+        )
+        try:
+            await process.wait()
+        finally:
+            self._subscriber.close()
+            self._batch_writer.close()
+            self._live_publisher.close()
 
-    def _on_message(self, msg: MonitorMsg) -> None:
-        self._incoming_data_store.latest_monitor_msg = msg
+    @asynccontextmanager
+    async def _lifespan(self, _: FastAPI) -> AsyncIterator[None]:
+        # The subscriber is started in the event loop of the server,
+        # so that asyncio subscribers deliver messages without going through a thread.
+        self._subscriber.start(self._on_message)
+        yield
+        self._subscriber.close()
+        self._batch_writer.close()
+
+    def _on_message(self, stream_msg: StreamMsg[MonitorMsg]) -> None:
+        user_id = stream_msg.stream_id or DEFAULT_USER_ID
+        msg = stream_msg.msg
+        seq = self._incoming_data_store.add(user_id, msg)
         if isinstance(msg.payload, ConcentrationStatus):
-            self._accumalated_score_store.add(msg.payload.overall_score)
+            accumalated_score_store = AccumalatedScoreStore(user_id)
+            accumalated_score_store.add(msg.payload.overall_score, msg.timestamp)
             if (
-                self._accumalated_score_store.accumalated_score
+                accumalated_score_store.accumalated_score
                 > self._parameter_store.evolution_threshold
             ):
-                self._parameter_store.is_evolved = True
+                self._parameter_store.set_evolved(user_id)
+
+        # The event is encoded once here and shared by all clients of the user.
+        frame = to_sse_frame(seq, msg.payload, user_id)
+        self._publish_live(
+            MonitorEvent(frame.seq, user_id, frame.data, self._parameter_store.is_evolved(user_id))
+        )
+
+    def _on_records_written(self, records: list[SQLModel]) -> None:
+        for record in records:
+            if isinstance(record, AggregatedConcentrationStatusBase):
+                self._publish_live(WindowsSaved(record.user_id, record.start_time, record.end_time))
+
+
+def create_fastapi_app(
+    lifespan: Callable[[FastAPI], AbstractAsyncContextManager[None]],
+) -> FastAPI:
+    fastapi_app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None, lifespan=lifespan)
+    fastapi_app.mount(path="/static", app=StaticFiles(directory=STATIC_DIR), name="static")
+    fastapi_app.include_router(router)
+    return fastapi_app
+
+
+def create_worker_app() -> FastAPI:
+    """Create the app of a worker process started by `App.run`, which is configured by environment variables.
+
+    The worker serves the clients from the live state published by the process receiving the monitor messages.
+    """
+    ParameterStore().evolution_threshold = float(os.environ[EVOLUTION_THRESHOLD_ENV])
+    subscriber = AsyncZmqSubscriber(os.environ[LIVE_ADDR_ENV], LIVE_TOPIC, LiveEventSerializer())
+
+    @asynccontextmanager
+    async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+        subscriber.start(apply_live_event)
+        yield
+        subscriber.close()
+
+    return create_fastapi_app(lifespan)
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+from collections import deque
+from threading import Lock
+from typing import Deque
+
+from .constants import DEFAULT_USER_ID
+from .sse import SseFrame
+
+logger = logging.getLogger(__name__)
+
+
+class MonitorBroadcastHub:
+    """Class to fan out encoded monitor events to the connected clients, with a single instance per user.
+
+    Each client has its own bounded queue. When a client does not keep up,
+    its oldest events are dropped so that it does not hold back the others.
+    The most recent events are kept so that reconnecting clients can resume where they left off.
+    """
+
+    _instances: dict[str, "MonitorBroadcastHub"] = {}
+    _lock = Lock()
+
+    _MAX_QUEUE_SIZE = 16
+    _MAX_HISTORY = 1024
+
+    def __new__(cls, user_id: str = DEFAULT_USER_ID) -> "MonitorBroadcastHub":
+        if user_id not in cls._instances:
+            with cls._lock:
+                if user_id not in cls._instances:
+                    instance = super(MonitorBroadcastHub, cls).__new__(cls)
+                    instance._initialized = False  # type: ignore
+                    cls._instances[user_id] = instance
+        return cls._instances[user_id]
+
+    def __init__(self, user_id: str = DEFAULT_USER_ID) -> None:
+        if self._initialized:  # type: ignore
+            return
+        self._initialized = True
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queues: set[asyncio.Queue[SseFrame]] = set()
+        self._user_id = user_id
+        self._history: Deque[SseFrame] = deque(maxlen=self._MAX_HISTORY)
+        # The sequence number of the latest event evicted from the history.
+        self._evicted_seq = 0
+        self._history_lock = Lock()
+
+    def subscribe(
+        self, last_seq: int | None = None
+    ) -> tuple[list[SseFrame], "asyncio.Queue[SseFrame]"]:
+        """Register a client. This must be called in the event loop of the server.
+
+        Args:
+            last_seq (int | None, optional): The sequence number of the last event received by a resuming client. If `None`, unknown to the hub, or older than the kept events, only the latest event is replayed.
+
+        Returns:
+            tuple[list[SseFrame], asyncio.Queue[SseFrame]]: The kept events to replay, and the queue receiving the events published from now on. An event may be both replayed and queued, so clients should skip events whose sequence number they already sent.
+        """
+        self._loop = asyncio.get_running_loop()
+        queue: asyncio.Queue[SseFrame] = asyncio.Queue(self._MAX_QUEUE_SIZE)
+        self._queues.add(queue)
+
+        with self._history_lock:
+            if not self._history:
+                return [], queue
+            if last_seq is None or last_seq > self._history[-1].seq:
+                return [self._history[-1]], queue
+            if self._evicted_seq > last_seq:
+                # Events were missed, so the client is resynchronized with the latest one.
+                logger.warning(
+                    "Client of user %s resumed from seq %d, older than the kept events",
+                    self._user_id,
+                    last_seq,
+                )
+                return [self._history[-1]], queue
+            return [frame for frame in self._history if frame.seq > last_seq], queue
+
+    def unsubscribe(self, queue: "asyncio.Queue[SseFrame]") -> None:
+        """Unregister a client.
+
+        Args:
+            queue (asyncio.Queue[SseFrame]): The queue returned by `subscribe`.
+        """
+        self._queues.discard(queue)
+
+    def publish(self, frame: SseFrame) -> None:
+        """Send an event to all clients. This can be called from any thread.
+
+        Args:
+            frame (SseFrame): The event to send.
+        """
+        with self._history_lock:
+            if len(self._history) == self._MAX_HISTORY:
+                self._evicted_seq = self._history[0].seq
+            self._history.append(frame)
+
+        loop = self._loop
+        if loop is None:
+            return
+
+        try:
+            running_loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is loop:
+            self._put(frame)
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(self._put, frame)
+
+    def _put(self, frame: SseFrame) -> None:
+        for queue in self._queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(frame)
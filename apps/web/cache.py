@@ -0,0 +1,106 @@
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from threading import Lock
+from typing import Hashable
+
+
+@dataclass(slots=True, frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    user_id: str
+    start_time: datetime
+    end_time: datetime
+
+
+class ResponseCache:
+    """Singleton class to cache the responses of history queries.
+
+    Entries are evicted in least recently used order,
+    and invalidated when a window of their user overlapping their time range is saved.
+    """
+
+    _instance: "ResponseCache | None" = None
+    _lock = Lock()
+
+    _MAX_SIZE = 256
+
+    def __new__(cls) -> "ResponseCache":
+        if cls._instance is None:
+            with cls._lock:
+                cls._instance = super(ResponseCache, cls).__new__(cls)
+                cls._instance._initialized = False  # type: ignore
+        return cls._instance
+
+    def __init__(self) -> None:
+        if self._initialized:  # type: ignore
+            return
+        self._initialized = True
+        self._entries: OrderedDict[Hashable, CachedResponse] = OrderedDict()
+        self._entries_lock = Lock()
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        """The number of invalidations so far. Read it before querying the data of an entry to put."""
+        return self._generation
+
+    def get(self, key: Hashable) -> CachedResponse | None:
+        with self._entries_lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(
+        self,
+        key: Hashable,
+        body: bytes,
+        user_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        *,
+        generation: int,
+    ) -> CachedResponse:
+        """Cache a response with a strong ETag derived from its body.
+
+        Args:
+            key (Hashable): The key of the query.
+            body (bytes): The body of the response.
+            user_id (str): The id of the queried user.
+            start_time (datetime): The start time of the queried range.
+            end_time (datetime): The end time of the queried range.
+            generation (int): The `generation` read before querying the data. If an invalidation happened since, the response is not cached as it may be stale.
+
+        Returns:
+            CachedResponse: The response with its ETag.
+        """
+        entry = CachedResponse(
+            body=body,
+            etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+            user_id=user_id,
+            start_time=start_time,
+            end_time=end_time,
+        )
+        with self._entries_lock:
+            if generation == self._generation:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self._MAX_SIZE:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, user_id: str, start_time: datetime, end_time: datetime) -> None:
+        """Drop the entries of a user whose range overlaps the given range."""
+        with self._entries_lock:
+            self._generation += 1
+            for key in [
+                key
+                for key, entry in self._entries.items()
+                if entry.user_id == user_id
+                and entry.start_time < end_time
+                and start_time < entry.end_time
+            ]:
+                del self._entries[key]
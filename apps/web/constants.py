@@ -8,3 +8,11 @@ INSTANCE_DIR: Final[str] = os.path.join(APP_ROOT, "instance")
 
 SQLITE_FILENAME: Final[str] = "monitor_records.db"
 SQLITE_URL: Final[str] = f"sqlite:///{os.path.join(INSTANCE_DIR, SQLITE_FILENAME)}"
+
+# The user of the messages published on the base monitor topic, i.e. without a stream id.
+DEFAULT_USER_ID: Final[str] = "default"
+
+# The accumulated score counts each score once per this interval (in seconds), the default interval of the local apps,
+# and a score is held at most for the gap (in seconds) after it, e.g. when a local app stops.
+SCORE_SAMPLE_INTERVAL: Final[float] = 0.2
+MAX_SCORE_HOLD_INTERVAL: Final[float] = 10.0
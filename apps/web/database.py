@@ -1,23 +1,246 @@
+import logging
+import queue
 from contextlib import contextmanager
-from typing import ContextManager, Generator
+from datetime import datetime
+from itertools import pairwise
+from sqlite3 import Connection as SQLiteConnection
+from threading import Thread
+from time import monotonic
+from typing import Any, Callable, ContextManager, Generator, Iterable
 
+from sqlalchemy import Engine, event, inspect, text
+from sqlalchemy.sql.schema import ScalarElementColumnDefault
 from sqlmodel import Session, SQLModel, create_engine
 
 from .constants import SQLITE_URL
 
-_engine = create_engine(SQLITE_URL, connect_args={"check_same_thread": False})
+logger = logging.getLogger(__name__)
+
+# Writes go through a single connection, while reads are served by a pool of read-only connections.
+# With WAL, readers do not block the writer and the writer does not block readers.
+_engine = create_engine(
+    SQLITE_URL, connect_args={"check_same_thread": False}, pool_size=1, max_overflow=0
+)
+_read_engine = create_engine(
+    SQLITE_URL, connect_args={"check_same_thread": False}, pool_size=8, max_overflow=8
+)
+
+
+def _set_pragmas(connection: SQLiteConnection, *, read_only: bool) -> None:
+    cursor = connection.cursor()
+    if not read_only:
+        # WAL is persistent in the database file, so only the writer needs to enable it.
+        cursor.execute("PRAGMA journal_mode=WAL")
+    # With WAL, NORMAL only syncs at checkpoints and stays consistent after a crash.
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-16000")  # 16 MiB
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    if read_only:
+        cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+def _register_pragmas(engine: Engine, *, read_only: bool) -> None:
+    @event.listens_for(engine, "connect")
+    def on_connect(connection: SQLiteConnection, _: Any) -> None:
+        _set_pragmas(connection, read_only=read_only)
+
+
+_register_pragmas(_engine, read_only=False)
+_register_pragmas(_read_engine, read_only=True)
 
 
 def create_db_and_tables() -> None:
     from . import schemas  # noqa: F401
 
+    existing_table_names = set(inspect(_engine).get_table_names())
     SQLModel.metadata.create_all(_engine)
+    _add_missing_columns()
+    _update_indexes()
+    _backfill_rollups(existing_table_names)
+
+
+def _add_missing_columns() -> None:
+    """Add the columns of the models that are missing from existing tables.
+
+    `create_all` does not alter existing tables, so databases created by older versions are migrated here.
+    """
+    with _engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+
+                ddl = (
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                    f"{column.type.compile(dialect=_engine.dialect)}"
+                )
+                if not column.nullable and isinstance(column.default, ScalarElementColumnDefault):
+                    ddl += f" NOT NULL DEFAULT {column.default.arg!r}"
+                connection.execute(text(ddl))
+
+
+def _update_indexes() -> None:
+    """Recreate the indexes of existing tables that differ from those of the models.
+
+    For example, the time columns were unique before the windows were saved per user.
+    """
+    with _engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in SQLModel.metadata.sorted_tables:
+            existing_indexes = {index["name"]: index for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                existing_index = existing_indexes.get(index.name)
+                if existing_index is not None:
+                    column_names = [column.name for column in index.columns]
+                    is_unique = bool(existing_index["unique"])
+                    if existing_index["column_names"] == column_names and is_unique == index.unique:
+                        continue
+                    connection.execute(text(f"DROP INDEX {index.name}"))
+                index.create(connection)
+
+
+def _backfill_rollups(existing_table_names: set[str]) -> None:
+    """Build the windows of the rollup tables added to an existing database from the windows of the finer ones.
+
+    For example, the 1-hour and 1-day windows are built from the 5-minute windows saved before they were added.
+    """
+    from .rollup import Resolution, backfill_rollups
+
+    with get_session_context() as session:
+        for source, resolution in pairwise(Resolution):
+            if resolution.model.__tablename__ in existing_table_names:
+                continue
+            backfill_rollups(session, resolution, source, resolution.floor(datetime.now()))
+            # The coarser tables are built from the windows added here.
+            session.flush()
+        session.commit()
 
 
 def get_session_generator() -> Generator[Session, None, None]:
-    with Session(_engine) as session:
+    """Yield a read-only session, which is meant to be used by request handlers."""
+    with Session(_read_engine) as session:
         yield session
 
 
-def get_session_context() -> ContextManager[Session]:
+def get_read_session_context() -> ContextManager[Session]:
+    """Get a context manager for a read-only session, e.g. to stream a response after the handler returned."""
     return contextmanager(get_session_generator)()
+
+
+def get_session_context() -> ContextManager[Session]:
+    """Get a context manager for a session of the single writer connection."""
+    return contextmanager(_get_write_session_generator)()
+
+
+def _get_write_session_generator() -> Generator[Session, None, None]:
+    # Written records stay readable after the commit, e.g. by the callback of `BatchWriter`.
+    with Session(_engine, expire_on_commit=False) as session:
+        yield session
+
+
+class BatchWriter:
+    """Write records in the background, committing the records queued meanwhile in a single transaction."""
+
+    def __init__(
+        self,
+        session_context_getter: Callable[[], ContextManager[Session]],
+        *,
+        max_batch_size: int = 256,
+        max_delay: float = 1.0,
+        on_commit: Callable[[list[SQLModel]], None] | None = None,
+    ) -> None:
+        """
+        Args:
+            session_context_getter (Callable[[], ContextManager[Session]]): Callable that returns a context manager for a session.
+            max_batch_size (int, optional): The maximum number of records committed at once.
+            max_delay (float, optional): The maximum time (in seconds) to wait for more records before committing.
+            on_commit (Callable[[list[SQLModel]], None] | None, optional): Function to call with the records of each committed batch.
+        """
+        self._session_context_getter = session_context_getter
+        self._max_batch_size = max_batch_size
+        self._max_delay = max_delay
+        self._on_commit = on_commit
+
+        self._queue: queue.Queue[SQLModel | None] = queue.Queue()
+        self._thread: Thread | None = None
+
+    def start(self) -> None:
+        """Begin writing queued records.
+
+        Raises:
+            RuntimeError: If the writer is already running.
+        """
+        if self._thread is not None:
+            raise RuntimeError("Writer is already running")
+
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, records: Iterable[SQLModel]) -> None:
+        """Queue records to write without blocking."""
+        for record in records:
+            self._queue.put(record)
+
+    def close(self) -> None:
+        """Write the queued records and stop the writer."""
+        self._queue.put(None)
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self) -> None:
+        is_running = True
+        while is_running:
+            record = self._queue.get()
+            if record is None:
+                break
+
+            batch = [record]
+            deadline = monotonic() + self._max_delay
+            while len(batch) < self._max_batch_size:
+                try:
+                    record = self._queue.get(timeout=max(deadline - monotonic(), 0))
+                except queue.Empty:
+                    break
+                if record is None:
+                    is_running = False
+                    break
+                batch.append(record)
+
+            self._commit(batch)
+
+    def _commit(self, batch: list[SQLModel]) -> None:
+        try:
+            self._commit_records(batch)
+        except Exception:
+            if len(batch) == 1:
+                logger.exception("Failed to write a record: %r", batch[0])
+                return
+            # Records are retried one by one, so that a bad record does not lose the whole batch.
+            logger.exception("Failed to write %d records, retrying them one by one", len(batch))
+            committed = []
+            for record in batch:
+                try:
+                    self._commit_records([record])
+                except Exception:
+                    logger.exception("Failed to write a record: %r", record)
+                else:
+                    committed.append(record)
+            batch = committed
+            if not batch:
+                return
+
+        if self._on_commit:
+            self._on_commit(batch)
+
+    def _commit_records(self, records: list[SQLModel]) -> None:
+        with self._session_context_getter() as session:
+            session.add_all(records)
+            session.commit()
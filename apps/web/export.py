@@ -0,0 +1,109 @@
+import csv
+import io
+from datetime import datetime
+from enum import Enum
+from importlib.util import find_spec
+from itertools import batched
+from typing import Iterable, Iterator, get_args
+
+import msgspec
+
+from .schemas import AggregatedConcentrationStatusBase
+
+# The number of rows fetched from the cursor and encoded at once.
+CHUNK_SIZE = 1000
+
+_FIELD_NAMES = list(AggregatedConcentrationStatusBase.model_fields)
+
+_json_encoder = msgspec.json.Encoder()
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+    ARROW = "arrow"
+
+    @property
+    def media_type(self) -> str:
+        return {
+            ExportFormat.NDJSON: "application/x-ndjson",
+            ExportFormat.CSV: "text/csv",
+            ExportFormat.ARROW: "application/vnd.apache.arrow.stream",
+        }[self]
+
+    def is_available(self) -> bool:
+        """Check whether the optional dependency of the format is installed."""
+        return self != ExportFormat.ARROW or find_spec("pyarrow") is not None
+
+    def __str__(self) -> str:
+        return self.value
+
+
+def iter_export(
+    rows: Iterable[AggregatedConcentrationStatusBase], export_format: ExportFormat
+) -> Iterator[bytes]:
+    """Encode rows chunk by chunk, so that the memory usage does not depend on the number of rows.
+
+    Args:
+        rows (Iterable[AggregatedConcentrationStatusBase]): The rows to export, e.g. from a cursor fetching `CHUNK_SIZE` rows at once.
+        export_format (ExportFormat): The format to encode the rows in.
+
+    Yields:
+        bytes: The encoded chunks.
+    """
+    chunks = (
+        [[getattr(row, name) for name in _FIELD_NAMES] for row in chunk]
+        for chunk in batched(rows, CHUNK_SIZE)
+    )
+    if export_format == ExportFormat.CSV:
+        yield from _iter_csv(chunks)
+    elif export_format == ExportFormat.ARROW:
+        yield from _iter_arrow(chunks)
+    else:
+        yield from _iter_ndjson(chunks)
+
+
+def _iter_ndjson(chunks: Iterable[list[list]]) -> Iterator[bytes]:
+    for chunk in chunks:
+        yield b"".join(
+            _json_encoder.encode(dict(zip(_FIELD_NAMES, values))) + b"\n" for values in chunk
+        )
+
+
+def _iter_csv(chunks: Iterable[list[list]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(_FIELD_NAMES)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _iter_arrow(chunks: Iterable[list[list]]) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    types = {datetime: pa.timestamp("us"), int: pa.int64(), float: pa.float64(), str: pa.string()}
+    schema_fields = []
+    for name in _FIELD_NAMES:
+        annotation = AggregatedConcentrationStatusBase.model_fields[name].annotation
+        # Optional fields are nullable columns of the type of their value.
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            annotation = args[0]
+        if annotation not in types:
+            raise TypeError(f"Field {name!r} of type {annotation!r} has no Arrow type")
+        schema_fields.append((name, types[annotation]))
+    schema = pa.schema(schema_fields)
+
+    buffer = io.BytesIO()
+    with pa.ipc.new_stream(buffer, schema) as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import msgspec
+from msgspec.msgpack import Decoder, Encoder
+
+from libs.ipc import BaseSerializer
+
+from .broadcast import MonitorBroadcastHub
+from .cache import ResponseCache
+from .sse import SseFrame
+from .store import ParameterStore
+
+# The topic of the live events published by the ingest process to the worker processes.
+LIVE_TOPIC = "live"
+
+
+class MonitorEvent(msgspec.Struct, tag=True, array_like=True):
+    """Represent a monitor message of a user, already encoded as a server-sent event."""
+
+    seq: int
+    user_id: str
+    data: bytes
+    is_evolved: bool
+
+
+class WindowsSaved(msgspec.Struct, tag=True, array_like=True):
+    """Represent the windows of a user saved within a time range."""
+
+    user_id: str
+    start_time: datetime
+    end_time: datetime
+
+
+LiveEvent = MonitorEvent | WindowsSaved
+
+
+class LiveEventSerializer(BaseSerializer[LiveEvent]):
+    def __init__(self) -> None:
+        self._encoder = Encoder()
+        self._decoder: Decoder[LiveEvent] = Decoder(LiveEvent)
+
+    def serialize(self, obj: LiveEvent) -> bytes:
+        return self._encoder.encode(obj)
+
+    def deserialize(self, data: bytes) -> LiveEvent:
+        return self._decoder.decode(data)
+
+
+def apply_live_event(event: LiveEvent) -> None:
+    """Apply a live event to the state of this process, which serves the clients.
+
+    Args:
+        event (LiveEvent): The event created by the process receiving the monitor messages, which may be this one.
+    """
+    if isinstance(event, MonitorEvent):
+        if event.is_evolved:
+            ParameterStore().set_evolved(event.user_id)
+        MonitorBroadcastHub(event.user_id).publish(SseFrame(event.seq, event.data))
+    else:
+        ResponseCache().invalidate(event.user_id, event.start_time, event.end_time)
@@ -0,0 +1,201 @@
+import math
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Iterator
+
+from sqlmodel import Session, select
+from sqlmodel.sql.expression import SelectOfScalar
+
+from .accumulator import WindowAccumulator
+from .schemas import (
+    AggregatedConcentrationStatus,
+    AggregatedConcentrationStatus1d,
+    AggregatedConcentrationStatus1h,
+    AggregatedConcentrationStatus1m,
+    AggregatedConcentrationStatusBase,
+)
+
+
+class Resolution(str, Enum):
+    """Enumerate resolutions of the aggregated concentration status, from the finest."""
+
+    ONE_MINUTE = "1m"
+    FIVE_MINUTES = "5m"
+    ONE_HOUR = "1h"
+    ONE_DAY = "1d"
+
+    @property
+    def interval(self) -> timedelta:
+        return _INTERVALS[self]
+
+    @property
+    def model(self) -> type[AggregatedConcentrationStatusBase]:
+        return _MODELS[self]
+
+    def floor(self, time: datetime) -> datetime:
+        """Get the start time of the window containing the given time."""
+        midnight = time.replace(hour=0, minute=0, second=0, microsecond=0)
+        return midnight + (time - midnight) // self.interval * self.interval
+
+    def __str__(self) -> str:
+        return self.value
+
+
+_INTERVALS = {
+    Resolution.ONE_MINUTE: timedelta(minutes=1),
+    Resolution.FIVE_MINUTES: timedelta(minutes=5),
+    Resolution.ONE_HOUR: timedelta(hours=1),
+    Resolution.ONE_DAY: timedelta(days=1),
+}
+
+# The number of rows fetched from the cursor at once when iterating over long ranges.
+_YIELD_PER = 500
+
+_MODELS: dict[Resolution, type[AggregatedConcentrationStatusBase]] = {
+    Resolution.ONE_MINUTE: AggregatedConcentrationStatus1m,
+    Resolution.FIVE_MINUTES: AggregatedConcentrationStatus,
+    Resolution.ONE_HOUR: AggregatedConcentrationStatus1h,
+    Resolution.ONE_DAY: AggregatedConcentrationStatus1d,
+}
+
+
+def select_resolution(start_time: datetime, end_time: datetime, max_points: int) -> Resolution:
+    """Select the finest resolution that covers a range with at most the given number of windows.
+
+    Args:
+        start_time (datetime): The start time of the range.
+        end_time (datetime): The end time of the range.
+        max_points (int): The maximum number of windows.
+
+    Returns:
+        Resolution: The selected resolution, or the coarsest one if none fits.
+    """
+    for resolution in Resolution:
+        if (end_time - start_time) / resolution.interval <= max_points:
+            return resolution
+    return Resolution.ONE_DAY
+
+
+def select_available_resolution(
+    session: Session, user_id: str, start_time: datetime, end_time: datetime, max_points: int
+) -> Resolution:
+    """Select the resolution of `select_resolution`, or the finest coarser one if it has no window within the range.
+
+    For example, the 1-minute windows are only saved since they were added, so older ranges only have coarser windows.
+    """
+    resolutions = list(Resolution)
+    selected = select_resolution(start_time, end_time, max_points)
+    for resolution in resolutions[resolutions.index(selected) :]:
+        statement = select_rollups(user_id, resolution, start_time, end_time).limit(1)
+        if session.exec(statement).first() is not None:
+            return resolution
+    return selected
+
+
+def backfill_rollups(
+    session: Session, resolution: Resolution, source: Resolution, until: datetime
+) -> None:
+    """Build the windows of a resolution by merging the saved windows of a finer one, e.g. when its table was added.
+
+    Args:
+        session (Session): The session to read and add the windows with. It is not committed.
+        resolution (Resolution): The resolution of the windows to build.
+        source (Resolution): The finer resolution of the saved windows to merge.
+        until (datetime): The time before which windows are built. The windows still open are left to the aggregator.
+    """
+    model = source.model
+    statement = (
+        select(model)
+        .where(model.end_time <= until)
+        .order_by(model.user_id, model.start_time)  # type: ignore[arg-type]
+        .execution_options(yield_per=_YIELD_PER)
+    )
+    key: tuple[str, datetime] | None = None
+    accumulator = WindowAccumulator()
+    for row in session.exec(statement):
+        row_key = (row.user_id, resolution.floor(row.start_time))
+        if key is not None and row_key != key:
+            session.add(_to_backfilled_record(accumulator, resolution, *key))
+            accumulator = WindowAccumulator()
+        key = row_key
+        accumulator.merge(WindowAccumulator.from_record(row))
+
+    if key is not None:
+        session.add(_to_backfilled_record(accumulator, resolution, *key))
+
+
+def _to_backfilled_record(
+    accumulator: WindowAccumulator, resolution: Resolution, user_id: str, start_time: datetime
+) -> AggregatedConcentrationStatusBase:
+    return accumulator.to_record(
+        resolution.model, user_id, start_time, start_time + resolution.interval
+    )
+
+
+def select_rollups(
+    user_id: str, resolution: Resolution, start_time: datetime, end_time: datetime
+) -> SelectOfScalar[AggregatedConcentrationStatusBase]:
+    """Build the query of the windows of a user and a resolution within a range, in chronological order."""
+    model = resolution.model
+    return (
+        select(model)
+        .where(model.user_id == user_id, model.start_time >= start_time, model.end_time <= end_time)
+        .order_by(model.start_time)  # type: ignore[arg-type]
+    )
+
+
+def iter_downsampled(
+    session: Session, user_id: str, start_time: datetime, end_time: datetime, max_points: int
+) -> Iterator[AggregatedConcentrationStatusBase]:
+    """Iterate over the aggregated concentration status within a range in at most the given number of points.
+
+    The finest resolution fitting in `max_points` and having windows within the range is read. If even daily windows do not fit,
+    consecutive windows are merged into buckets of equal duration.
+
+    Args:
+        session (Session): The session to read the windows with.
+        user_id (str): The id of the user.
+        start_time (datetime): The start time of the range.
+        end_time (datetime): The end time of the range.
+        max_points (int): The maximum number of points.
+
+    Yields:
+        AggregatedConcentrationStatusBase: The points in chronological order.
+    """
+    resolution = select_available_resolution(session, user_id, start_time, end_time, max_points)
+    statement = select_rollups(user_id, resolution, start_time, end_time).execution_options(
+        yield_per=_YIELD_PER
+    )
+    rows = session.exec(statement)
+
+    num_windows = math.ceil((end_time - start_time) / resolution.interval)
+    if num_windows <= max_points:
+        yield from rows
+        return
+
+    bucket_interval = resolution.interval * math.ceil(num_windows / max_points)
+    origin = resolution.floor(start_time)
+    bucket_start_time: datetime | None = None
+    accumulator = WindowAccumulator()
+    for row in rows:
+        row_bucket_start_time = (
+            origin + (row.start_time - origin) // bucket_interval * bucket_interval
+        )
+        if bucket_start_time is not None and row_bucket_start_time != bucket_start_time:
+            yield accumulator.to_record(
+                AggregatedConcentrationStatusBase,
+                user_id,
+                bucket_start_time,
+                bucket_start_time + bucket_interval,
+            )
+            accumulator = WindowAccumulator()
+        bucket_start_time = row_bucket_start_time
+        accumulator.merge(WindowAccumulator.from_record(row))
+
+    if bucket_start_time is not None:
+        yield accumulator.to_record(
+            AggregatedConcentrationStatusBase,
+            user_id,
+            bucket_start_time,
+            bucket_start_time + bucket_interval,
+        )
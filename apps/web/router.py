@@ -1,109 +1,219 @@
+import re
 from dataclasses import fields
-from datetime import date, datetime, timedelta
-from enum import Enum
-from typing import Annotated, Sequence
+from datetime import date, datetime, time, timedelta
+from typing import Annotated, AsyncIterator, Iterator, Sequence
 
-from fastapi import APIRouter, Depends, Request
-from fastapi.responses import HTMLResponse, StreamingResponse
+import msgspec
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Session, select
-
-from libs.schemas.monitor_msg import ConcentrationStatus, MonitorError
-
-from .constants import TEMPLATES_DIR
-from .database import get_session_generator
-from .schemas import AggregatedConcentrationStatus
-from .store import AccumalatedScoreStore, IncomingDataStore, ParameterStore
+from sqlmodel import Session
+
+from .broadcast import MonitorBroadcastHub
+from .cache import ResponseCache
+from .constants import DEFAULT_USER_ID, TEMPLATES_DIR
+from .database import get_read_session_context, get_session_generator
+from .export import CHUNK_SIZE as EXPORT_CHUNK_SIZE
+from .export import ExportFormat, iter_export
+from .rollup import Resolution, iter_downsampled, select_available_resolution, select_rollups
+from .schemas import AggregatedConcentrationStatusBase
+from .store import ParameterStore
 
 router = APIRouter()
 
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
 
-IncomingDataStoreDep = Annotated[IncomingDataStore, Depends(IncomingDataStore)]
+_json_encoder = msgspec.json.Encoder()
+
+# The time after the end of a range until its last window is closed and saved.
+_FINALIZATION_DELAY = timedelta(minutes=2)
+# The characters replaced in the user ids of the names of exported files.
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
 ParameterStoreDep = Annotated[ParameterStore, Depends(ParameterStore)]
+ResponseCacheDep = Annotated[ResponseCache, Depends(ResponseCache)]
+
+# Every route is served for each user under /users/{user_id}, and for the default user without the prefix.
 
 
 @router.get("/", response_class=HTMLResponse)
-async def root(request: Request, store: ParameterStoreDep) -> HTMLResponse:
+@router.get("/users/{user_id}", response_class=HTMLResponse)
+async def root(
+    request: Request, store: ParameterStoreDep, user_id: str = DEFAULT_USER_ID
+) -> HTMLResponse:
     return templates.TemplateResponse(
         "index.html",
         {
             "request": request,
             "evolution_threshold": store.evolution_threshold,
-            "is_evolved": 1 if store.is_evolved else 0,
+            "is_evolved": 1 if store.is_evolved(user_id) else 0,
+            "monitor_url": router.url_path_for("monitor", user_id=user_id),
         },
     )
 
 
-class EventType(str, Enum):
-    STATUS = "status_msg"
-    ERROR = "error_msg"
-
-    @classmethod
-    def from_status_or_error(
-        cls, status_or_error: ConcentrationStatus | MonitorError
-    ) -> "EventType":
-        if isinstance(status_or_error, ConcentrationStatus):
-            return cls.STATUS
-        return cls.ERROR
-
-    def __str__(self) -> str:
-        return self.value
-
-
-def to_json(status_or_error: ConcentrationStatus | MonitorError) -> dict:
-    if isinstance(status_or_error, ConcentrationStatus):
-        return {
-            "overall_score": status_or_error.overall_score,
-            "penalty_factor": status_or_error.penalty_factor.get_active_factor_names(),
-            "accumulated_score": AccumalatedScoreStore().accumalated_score,
-        }
-    return {"type": status_or_error.type.name, "msg": status_or_error.msg}
-
-
-def to_sse_msg(status_or_error: ConcentrationStatus | MonitorError) -> str:
-    event = EventType.from_status_or_error(status_or_error)
-    data = to_json(status_or_error)
-    return f"event: {event}\ndata: {data}\n\n"
-
-
 @router.get("/monitor")
-def monitor(
-    store: IncomingDataStoreDep,
+@router.get("/users/{user_id}/monitor")
+async def monitor(
+    user_id: str = DEFAULT_USER_ID, last_event_id: Annotated[int | None, Header()] = None
 ) -> StreamingResponse:
-    def generator(store: IncomingDataStoreDep):
-        if store.latest_monitor_msg:
-            yield to_sse_msg(store.latest_monitor_msg.payload)
-        while True:
-            store.wait_for_change()
-            if store.latest_monitor_msg:
-                yield to_sse_msg(store.latest_monitor_msg.payload)
+    hub = MonitorBroadcastHub(user_id)
+
+    async def generator() -> AsyncIterator[bytes]:
+        frames, queue = hub.subscribe(last_event_id)
+        last_seq = 0
+        try:
+            for frame in frames:
+                yield frame.data
+                last_seq = frame.seq
+            while True:
+                frame = await queue.get()
+                if frame.seq > last_seq:
+                    yield frame.data
+                    last_seq = frame.seq
+        finally:
+            hub.unsubscribe(queue)
 
     return StreamingResponse(
-        generator(store),
+        generator(),
         media_type="text/event-stream",
         headers={"Connection": "keep-alive", "Cache-Control": "no-cache"},
     )
 
 
-@router.get("/status/by-date", response_model=Sequence[AggregatedConcentrationStatus])
+@router.get("/status/by-date", response_model=Sequence[AggregatedConcentrationStatusBase])
+@router.get(
+    "/users/{user_id}/status/by-date", response_model=Sequence[AggregatedConcentrationStatusBase]
+)
 def get_status_by_date(
-    target_date: date, session: Annotated[Session, Depends(get_session_generator)]
-) -> Sequence[AggregatedConcentrationStatus]:
-    statement = select(AggregatedConcentrationStatus).where(
-        AggregatedConcentrationStatus.start_time >= target_date,
-        AggregatedConcentrationStatus.end_time <= target_date + timedelta(days=1),
+    target_date: date,
+    request: Request,
+    session: Annotated[Session, Depends(get_session_generator)],
+    cache: ResponseCacheDep,
+    user_id: str = DEFAULT_USER_ID,
+    max_points: int | None = None,
+) -> Response:
+    start_time = datetime.combine(target_date, time())
+    return _get_status(
+        request, session, cache, user_id, start_time, start_time + timedelta(days=1), max_points
     )
-    return session.exec(statement).all()
 
 
-@router.get("/status/by-hour", response_model=Sequence[AggregatedConcentrationStatus])
+@router.get("/status/by-hour", response_model=Sequence[AggregatedConcentrationStatusBase])
+@router.get(
+    "/users/{user_id}/status/by-hour", response_model=Sequence[AggregatedConcentrationStatusBase]
+)
 def get_status_by_hour(
-    target_hour: datetime, session: Annotated[Session, Depends(get_session_generator)]
-) -> Sequence[AggregatedConcentrationStatus]:
+    target_hour: datetime,
+    request: Request,
+    session: Annotated[Session, Depends(get_session_generator)],
+    cache: ResponseCacheDep,
+    user_id: str = DEFAULT_USER_ID,
+    max_points: int | None = None,
+) -> Response:
     target_hour = target_hour.replace(minute=0, second=0, microsecond=0)
-    statement = select(AggregatedConcentrationStatus).where(
-        AggregatedConcentrationStatus.start_time >= target_hour,
-        AggregatedConcentrationStatus.end_time <= target_hour + timedelta(hours=1),
+    return _get_status(
+        request, session, cache, user_id, target_hour, target_hour + timedelta(hours=1), max_points
+    )
+
+
+def _get_status(
+    request: Request,
+    session: Session,
+    cache: ResponseCache,
+    user_id: str,
+    start_time: datetime,
+    end_time: datetime,
+    max_points: int | None,
+) -> Response:
+    # Without max_points, the 5-minute windows are returned as before.
+    resolution = (
+        Resolution.FIVE_MINUTES
+        if max_points is None
+        else select_available_resolution(session, user_id, start_time, end_time, max_points)
+    )
+
+    key = (user_id, resolution, start_time, end_time)
+    entry = cache.get(key)
+    if entry is None:
+        generation = cache.generation
+        rows = session.exec(select_rollups(user_id, resolution, start_time, end_time)).all()
+        body = _json_encoder.encode([row.model_dump() for row in rows])
+        entry = cache.put(key, body, user_id, start_time, end_time, generation=generation)
+
+    # Windows are saved once they are closed, so past ranges never change again.
+    is_finalized = end_time + _FINALIZATION_DELAY <= datetime.now()
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": "public, max-age=31536000, immutable" if is_finalized else "no-cache",
+    }
+    if _matches_etag(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+def _matches_etag(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    return any(tag.strip() in (etag, "*") for tag in if_none_match.split(","))
+
+
+@router.get("/status/range")
+@router.get("/users/{user_id}/status/range")
+def get_status_range(
+    start: datetime,
+    end: datetime,
+    user_id: str = DEFAULT_USER_ID,
+    max_points: Annotated[int, Query(ge=1, le=10000)] = 600,
+) -> StreamingResponse:
+    """Stream the aggregated concentration status within a range as a JSON array of at most `max_points` points."""
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+
+    def generator() -> Iterator[bytes]:
+        # The session is opened here since the response is streamed after the handler returns.
+        with get_read_session_context() as session:
+            yield b"["
+            for i, point in enumerate(iter_downsampled(session, user_id, start, end, max_points)):
+                yield (b"," if i else b"") + _json_encoder.encode(point.model_dump())
+            yield b"]"
+
+    return StreamingResponse(generator(), media_type="application/json")
+
+
+@router.get("/status/export")
+@router.get("/users/{user_id}/status/export")
+def export_status(
+    start: datetime,
+    end: datetime,
+    user_id: str = DEFAULT_USER_ID,
+    format: ExportFormat = ExportFormat.NDJSON,
+    resolution: Resolution = Resolution.FIVE_MINUTES,
+) -> StreamingResponse:
+    """Stream the aggregated concentration status within a range for bulk export."""
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if not format.is_available():
+        raise HTTPException(
+            status_code=501, detail=f"Export in {format} requires an optional dependency"
+        )
+
+    def generator() -> Iterator[bytes]:
+        # The session is opened here since the response is streamed after the handler returns.
+        with get_read_session_context() as session:
+            statement = select_rollups(user_id, resolution, start, end).execution_options(
+                yield_per=EXPORT_CHUNK_SIZE
+            )
+            yield from iter_export(session.exec(statement), format)
+
+    # The user id comes from the request, so it is reduced to characters that are safe in the header.
+    safe_user_id = _UNSAFE_FILENAME_CHARS.sub("_", user_id)
+    filename = (
+        f"concentration_status_{safe_user_id}_{resolution}"
+        f"_{start:%Y%m%d%H%M}_{end:%Y%m%d%H%M}.{format}"
+    )
+    return StreamingResponse(
+        generator(),
+        media_type=format.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
-    return session.exec(statement).all()
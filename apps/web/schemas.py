@@ -1,12 +1,56 @@
 from datetime import datetime
 
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 
+from .constants import DEFAULT_USER_ID
+
+
+class AggregatedConcentrationStatusBase(SQLModel):
+    user_id: str = DEFAULT_USER_ID
+    start_time: datetime = Field(index=True)
+    end_time: datetime = Field(index=True)
+    overall_score: float
+    sample_count: int = 0
+    min_score: float | None = None
+    max_score: float | None = None
+    score_std: float = 0.0
+    time_weighted_score: float | None = None
+    absent_count: int = 0
+    drowsy_count: int = 0
+    looking_away_count: int = 0
+
+
+def _user_window_index(table_name: str) -> Index:
+    # Each user has a single window per start time, and queries select the windows of a user within a range.
+    return Index(f"ix_{table_name}_user_id_start_time", "user_id", "start_time", unique=True)
+
+
+class AggregatedConcentrationStatus1m(AggregatedConcentrationStatusBase, table=True):
+    __tablename__ = "aggregated_concentration_status_1m"
+    __table_args__ = (_user_window_index(__tablename__),)
+
+    id: int | None = Field(default=None, primary_key=True)
+
+
+class AggregatedConcentrationStatus(AggregatedConcentrationStatusBase, table=True):
+    """Aggregated concentration status of 5-minute windows."""
 
-class AggregatedConcentrationStatus(SQLModel, table=True):
     __tablename__ = "aggregated_concentration_status"
+    __table_args__ = (_user_window_index(__tablename__),)
+
+    id: int | None = Field(default=None, primary_key=True)
+
+
+class AggregatedConcentrationStatus1h(AggregatedConcentrationStatusBase, table=True):
+    __tablename__ = "aggregated_concentration_status_1h"
+    __table_args__ = (_user_window_index(__tablename__),)
+
+    id: int | None = Field(default=None, primary_key=True)
+
+
+class AggregatedConcentrationStatus1d(AggregatedConcentrationStatusBase, table=True):
+    __tablename__ = "aggregated_concentration_status_1d"
+    __table_args__ = (_user_window_index(__tablename__),)
 
     id: int | None = Field(default=None, primary_key=True)
-    start_time: datetime = Field(index=True, unique=True)
-    end_time: datetime = Field(index=True, unique=True)
-    overall_score: float
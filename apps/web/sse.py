@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+from enum import Enum
+
+import msgspec
+
+from libs.schemas.monitor_msg import ConcentrationStatus, MonitorError
+
+from .store import AccumalatedScoreStore
+
+_json_encoder = msgspec.json.Encoder()
+
+
+@dataclass(slots=True, frozen=True)
+class SseFrame:
+    """Server-sent event encoded once and shared by all clients."""
+
+    seq: int
+    data: bytes
+
+
+class EventType(str, Enum):
+    STATUS = "status_msg"
+    ERROR = "error_msg"
+
+    @classmethod
+    def from_status_or_error(
+        cls, status_or_error: ConcentrationStatus | MonitorError
+    ) -> "EventType":
+        if isinstance(status_or_error, ConcentrationStatus):
+            return cls.STATUS
+        return cls.ERROR
+
+    def __str__(self) -> str:
+        return self.value
+
+
+def to_json(status_or_error: ConcentrationStatus | MonitorError, user_id: str) -> dict:
+    if isinstance(status_or_error, ConcentrationStatus):
+        return {
+            "overall_score": status_or_error.overall_score,
+            "penalty_factor": status_or_error.penalty_factor.get_active_factor_names(),
+            "accumulated_score": AccumalatedScoreStore(user_id).accumalated_score,
+        }
+    return {"type": status_or_error.type.name, "msg": status_or_error.msg}
+
+
+def to_sse_frame(
+    seq: int, status_or_error: ConcentrationStatus | MonitorError, user_id: str
+) -> SseFrame:
+    """Encode a message into a server-sent event.
+
+    Args:
+        seq (int): The sequence number of the message, sent as the event id so that clients can resume with `Last-Event-ID`.
+        status_or_error (ConcentrationStatus | MonitorError): The payload of the message.
+        user_id (str): The id of the user the message is about.
+
+    Returns:
+        SseFrame: The encoded event.
+    """
+    event = EventType.from_status_or_error(status_or_error)
+    data = _json_encoder.encode(to_json(status_or_error, user_id))
+    return SseFrame(seq, b"id: %d\nevent: %s\ndata: %s\n\n" % (seq, event.value.encode(), data))
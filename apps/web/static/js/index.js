@@ -79,10 +79,10 @@ let restartHandler = () => {
 setInterval(restartHandler, 1500);
 
 const createEventSource = () => {
-   const es = new EventSource('/monitor');
+   const es = new EventSource(MONITOR_URL);
 
    es.addEventListener('status_msg', function (event) {
-      const data = JSON.parse(event.data.replaceAll("'", '"'))
+      const data = JSON.parse(event.data)
       console.log(data)
 
       const currentScore = data["overall_score"]
@@ -103,7 +103,7 @@ const createEventSource = () => {
       }
    });
    es.addEventListener('error_msg', function (event) {
-      const data = JSON.parse(event.data.replaceAll("'", '"'))
+      const data = JSON.parse(event.data)
       console.log(data);
    });
    es.addEventListener('error', function (event) {
@@ -1,14 +1,38 @@
-from threading import Event, Lock
+import logging
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from threading import Condition, Lock
+from typing import Deque
 
 from libs.schemas.monitor_msg import MonitorMsg
 
+from .constants import DEFAULT_USER_ID, MAX_SCORE_HOLD_INTERVAL, SCORE_SAMPLE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True, frozen=True)
+class SequencedMonitorMsg:
+    seq: int
+    user_id: str
+    msg: MonitorMsg
+    received_time: datetime
+
 
 class IncomingDataStore:
-    """Singleton class to store data received via IPC."""
+    """Singleton class to store data received via IPC from all users.
+
+    Each message is numbered with a sequence number that increases by one across users,
+    and the most recent messages of each user are kept so that consumers can catch up from a cursor without missing any.
+    Since the history is kept per user, a busy user does not evict the messages of the others.
+    """
 
     _instance: "IncomingDataStore | None" = None
     _lock = Lock()
 
+    _MAX_HISTORY = 1024
+
     def __new__(cls) -> "IncomingDataStore":
         if cls._instance is None:
             with cls._lock:
@@ -20,52 +44,110 @@ class IncomingDataStore:
         if self._initialized:  # type: ignore
             return
         self._initialized = True
-        self._latest_monitor_msg: MonitorMsg | None = None
-        self._changed_event = Event()
+        self._latest_seq = 0
+        self._histories: dict[str, Deque[SequencedMonitorMsg]] = {}
+        # The sequence number of the latest message evicted from the history of each user.
+        self._evicted_seqs: dict[str, int] = {}
+        self._changed = Condition()
+
+    def add(self, user_id: str, msg: MonitorMsg) -> int:
+        """Store a message and wake up the waiting consumers.
 
-    def wait_for_change(self, timeout: float | None = None) -> bool:
-        """Wait for the data to change.
+        Args:
+            user_id (str): The id of the user the message is about.
+            msg (MonitorMsg): The received message.
+
+        Returns:
+            int: The sequence number of the message.
+        """
+        with self._changed:
+            self._latest_seq += 1
+            history = self._histories.get(user_id)
+            if history is None:
+                history = self._histories[user_id] = deque(maxlen=self._MAX_HISTORY)
+            elif len(history) == self._MAX_HISTORY:
+                self._evicted_seqs[user_id] = history[0].seq
+            history.append(SequencedMonitorMsg(self._latest_seq, user_id, msg, datetime.now()))
+            self._changed.notify_all()
+            return self._latest_seq
+
+    def wait_for(self, after_seq: int, timeout: float | None = None) -> list[SequencedMonitorMsg]:
+        """Wait for messages newer than a cursor.
 
         Args:
-            timeout (float | None, optional): The maximum time (in seconds) to wait for the event. If `None`, waits indefinitely.
+            after_seq (int): The sequence number of the last message seen by the consumer. Use `latest_seq` to start from now, or 0 to start from the oldest kept messages.
+            timeout (float | None, optional): The maximum time (in seconds) to wait for a message. If `None`, waits indefinitely.
 
         Returns:
-            bool: `True` if the event was set within the timeout period, `False` if the timeout was reached.
+            list[SequencedMonitorMsg]: The kept messages newer than the cursor in order, or an empty list if the timeout was reached. If the consumer fell behind by more than the kept history of a user, the missed messages of the user are logged and not included, so that the consumer resumes from the oldest kept ones.
         """
-        return self._changed_event.wait(timeout)
+        with self._changed:
+            self._changed.wait_for(lambda: self._latest_seq > after_seq, timeout)
+            items: list[SequencedMonitorMsg] = []
+            for user_id, history in self._histories.items():
+                evicted_seq = self._evicted_seqs.get(user_id, 0)
+                if after_seq and evicted_seq > after_seq:
+                    logger.warning(
+                        "Missed the messages of user %s from seq %d to %d",
+                        user_id,
+                        after_seq + 1,
+                        evicted_seq,
+                    )
+                # Only the tail of each history is newer than the cursor.
+                for item in reversed(history):
+                    if item.seq <= after_seq:
+                        break
+                    items.append(item)
+            items.sort(key=lambda item: item.seq)
+            return items
 
     @property
-    def latest_monitor_msg(self) -> MonitorMsg | None:
-        return self._latest_monitor_msg
+    def latest_seq(self) -> int:
+        return self._latest_seq
 
-    @latest_monitor_msg.setter
-    def latest_monitor_msg(self, value: MonitorMsg | None) -> None:
-        self._latest_monitor_msg = value
-        self._changed_event.set()
-        self._changed_event.clear()
+    def get_latest_monitor_msg(self, user_id: str) -> MonitorMsg | None:
+        with self._changed:
+            history = self._histories.get(user_id)
+            return history[-1].msg if history else None
 
 
 class AccumalatedScoreStore:
-    """Singleton class to store accumalated score."""
+    """Class to store accumalated score, with a single instance per user."""
 
-    _instance: "AccumalatedScoreStore | None" = None
+    _instances: dict[str, "AccumalatedScoreStore"] = {}
     _lock = Lock()
 
-    def __new__(cls) -> "AccumalatedScoreStore":
-        if cls._instance is None:
+    def __new__(cls, user_id: str = DEFAULT_USER_ID) -> "AccumalatedScoreStore":
+        if user_id not in cls._instances:
             with cls._lock:
-                cls._instance = super(AccumalatedScoreStore, cls).__new__(cls)
-                cls._instance._initialized = False  # type: ignore
-        return cls._instance
+                if user_id not in cls._instances:
+                    instance = super(AccumalatedScoreStore, cls).__new__(cls)
+                    instance._initialized = False  # type: ignore
+                    cls._instances[user_id] = instance
+        return cls._instances[user_id]
 
-    def __init__(self) -> None:
+    def __init__(self, user_id: str = DEFAULT_USER_ID) -> None:
         if self._initialized:  # type: ignore
             return
         self._initialized = True
         self._accumalated_score: float = 0
+        self._last_score: float = 0
+        self._last_time: datetime | None = None
 
-    def add(self, score: float) -> None:
-        self._accumalated_score += score
+    def add(self, score: float, time: datetime) -> None:
+        """Add a score, weighted by the time since the previous one.
+
+        Each score is held until the next one, so that the accumulated score does not depend on how often the scores are sent.
+
+        Args:
+            score (float): The score to add.
+            time (datetime): The time of the score.
+        """
+        if self._last_time is not None:
+            elapsed = min(max((time - self._last_time).total_seconds(), 0), MAX_SCORE_HOLD_INTERVAL)
+            self._accumalated_score += self._last_score * elapsed / SCORE_SAMPLE_INTERVAL
+        self._last_score = score
+        self._last_time = time
 
     @property
     def accumalated_score(self) -> float:
@@ -73,7 +155,7 @@ class AccumalatedScoreStore:
 
 
 class ParameterStore:
-    """Singleton class to store parameters."""
+    """Singleton class to store parameters, including those of each user."""
 
     _instance: "ParameterStore | None" = None
     _lock = Lock()
@@ -90,7 +172,7 @@ class ParameterStore:
             return
         self._initialized = True
         self._evolution_threshold: float = 0.0
-        self._is_evolved = False
+        self._evolved_user_ids: set[str] = set()
 
     @property
     def evolution_threshold(self) -> float | None:
@@ -100,10 +182,8 @@ class ParameterStore:
     def evolution_threshold(self, value: float) -> None:
         self._evolution_threshold = value
 
-    @property
-    def is_evolved(self) -> bool:
-        return self._is_evolved
+    def is_evolved(self, user_id: str) -> bool:
+        return user_id in self._evolved_user_ids
 
-    @is_evolved.setter
-    def is_evolved(self, value: bool) -> None:
-        self._is_evolved = value
+    def set_evolved(self, user_id: str) -> None:
+        self._evolved_user_ids.add(user_id)
@@ -1,8 +1,8 @@
-from .schemas import Config
+from .schemas import Config, FrameCodecParameters
 
 
 def read_config(config_file: str) -> Config:
     return Config.from_yaml_file(config_file)
 
 
-__all__ = ["Config", "read_config"]
+__all__ = ["Config", "FrameCodecParameters", "read_config"]
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from dataclass_wizard import YAMLWizard
 
@@ -10,6 +10,22 @@ class WebParameters:
     monitor_subscriber_addr: str
     monitor_topic: str
     evolution_threshold: float = 5000
+    workers: int = 1
+    live_addr: str = "/tmp/sozo_web_live"
+
+
+@dataclass(slots=True, frozen=True)
+class FrameCodecParameters:
+    codec: str | None = None
+    quality: int = 95
+    max_size: int | None = None
+    grayscale: bool = False
+
+
+@dataclass(slots=True, frozen=True)
+class VideoSourceParameters:
+    stream_id: str
+    video_path_or_device_id: str | int = 0
 
 
 @dataclass(slots=True, frozen=True)
@@ -20,12 +36,21 @@ class LocalParameters:
     frame_topic: str
     analysis_subscriber_addr: str
     analysis_topic: str
+    stream_id: str | None = None
     video_path_or_device_id: str | int = 0
+    sources: list[VideoSourceParameters] = field(default_factory=list)
+    capture_prefetch_size: int = 2
+    replay_factor: float = 1.0
     max_buffer_size: int = 10
     ear_threshold: float = 0.25
     looking_away_x_threshold: float = 25.0
     looking_away_penalty: float = 50.0
     head_direction_std_weight: float = 50.0
+    monitor_rate: float = 5.0
+    monitor_change_threshold: float = 0.0
+    monitor_heartbeat_interval: float = 5.0
+    frame_codec: FrameCodecParameters = field(default_factory=FrameCodecParameters)
+    frame_hwm: int = 2
 
 
 @dataclass(slots=True, frozen=True)
@@ -34,6 +59,17 @@ class ProcessingParameters:
     frame_topic: str
     analysis_publisher_addr: str
     analysis_topic: str
+    stream_ids: list[str] = field(default_factory=list)
+    frame_hwm: int = 2
+    face_redetect_interval: int = 10
+    max_batch_size: int = 8
+    pipeline_workers: int = 0
+    pipeline_max_in_flight: int = 8
+    headless: bool = False
+    overlay_publisher_addr: str | None = None
+    overlay_topic: str = "overlay"
+    overlay_max_fps: float = 5.0
+    overlay_codec: FrameCodecParameters = field(default_factory=FrameCodecParameters)
 
 
 @dataclass(slots=True, frozen=True)
@@ -1,17 +1,26 @@
 from .analysis_msg_serializer import AnalysisMsgSerializer
-from .base_pubsub import BasePublisher, BaseSubscriber
+from .base_pubsub import BasePublisher, BaseSubscriber, StreamMsg, SubscriberStats
 from .base_serializer import BaseSerializer
-from .image_serializer import ImageSerializer
+from .image_serializer import ImageCodec, ImageSerializer, RawImageSerializer
 from .monitor_msg_serializer import MonitorMsgSerializer
-from .zmq_pubsub import ZmqPublisher, ZmqSubscriber
+from .shm_pubsub import ShmFramePublisher, ShmFrameSubscriber
+from .zmq_pubsub import AsyncZmqSubscriber, ZmqPublisher, ZmqSubscriber, stream_topic
 
 __all__ = [
     "BasePublisher",
     "BaseSubscriber",
     "ZmqPublisher",
     "ZmqSubscriber",
+    "AsyncZmqSubscriber",
+    "ShmFramePublisher",
+    "ShmFrameSubscriber",
+    "SubscriberStats",
+    "StreamMsg",
+    "stream_topic",
     "BaseSerializer",
     "AnalysisMsgSerializer",
     "MonitorMsgSerializer",
+    "ImageCodec",
     "ImageSerializer",
+    "RawImageSerializer",
 ]
@@ -1,4 +1,5 @@
 from abc import ABCMeta, abstractmethod
+from dataclasses import dataclass
 from typing import Generic, TypeVar
 
 from libs.types import Callback
@@ -6,6 +7,34 @@ from libs.types import Callback
 Msg = TypeVar("Msg")
 
 
+@dataclass(slots=True, frozen=True)
+class SubscriberStats:
+    """Represent the message counters of a subscriber.
+
+    Attributes:
+        received (int): The number of messages that arrived at the subscriber.
+        delivered (int): The number of messages passed to the callback.
+        discarded (int): The number of messages dropped without being passed to the callback, e.g. because a newer one arrived.
+    """
+
+    received: int
+    delivered: int
+    discarded: int
+
+
+@dataclass(slots=True, frozen=True)
+class StreamMsg(Generic[Msg]):
+    """Represent a message tagged with the stream it was published on.
+
+    Attributes:
+        stream_id (str | None): The stream id of the message, or `None` if it was published on the base topic.
+        msg (Msg): The message.
+    """
+
+    stream_id: str | None
+    msg: Msg
+
+
 class BasePublisher(Generic[Msg], metaclass=ABCMeta):
     @abstractmethod
     def publish(self, msg: Msg) -> None:
@@ -1,5 +1,5 @@
 from abc import ABCMeta, abstractmethod
-from typing import Generic, TypeVar
+from typing import Generic, Sequence, TypeVar
 
 T = TypeVar("T")
 
@@ -10,3 +10,18 @@ class BaseSerializer(Generic[T], metaclass=ABCMeta):
 
     @abstractmethod
     def deserialize(self, data: bytes) -> T: ...
+
+    def serialize_multipart(self, obj: T) -> list[bytes | memoryview]:
+        """Serialize an object into the parts of a multipart message.
+
+        Transports supporting multipart messages use this instead of `serialize`,
+        so that large buffers can be sent without being copied into a single bytes object.
+        """
+        return [self.serialize(obj)]
+
+    def deserialize_multipart(self, parts: Sequence[memoryview]) -> T:
+        """Deserialize an object from the parts created by `serialize_multipart`.
+
+        The parts may be views of the received message and must not be modified.
+        """
+        return self.deserialize(bytes(parts[0]))
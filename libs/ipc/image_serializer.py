@@ -1,7 +1,11 @@
-from typing import Final
+import struct
+from enum import Enum
+from typing import Sequence
 
 import cv2
+import msgspec
 import numpy as np
+from msgspec.msgpack import Decoder, Encoder
 
 from libs.types import MatLike
 
@@ -10,15 +14,144 @@ from .base_serializer import BaseSerializer
 # TODO: raise exception from ret_code
 
 
+class ImageCodec(str, Enum):
+    """Enumerate codecs of serialized images."""
+
+    JPEG = "jpeg"
+    WEBP = "webp"
+    PNG = "png"
+    RAW = "raw"
+    """Raw pixel buffer, which is sent and received without being copied by multipart transports."""
+
+
+class _ImageHeader(msgspec.Struct, array_like=True):
+    codec: ImageCodec
+    scale: float
+    shape: tuple[int, ...] = ()
+    dtype: str = ""
+    strides: tuple[int, ...] = ()
+    grayscale: bool = False
+
+
 class ImageSerializer(BaseSerializer[MatLike]):
-    ext: Final[str] = ".jpg"
+    """Serializer encoding images with a configurable codec and pre-encoding transform.
+
+    The codec and the scale are recorded in a header, so any `ImageSerializer` can deserialize the image
+    regardless of the parameters of the sender.
+    """
 
-    def __init__(self, jpg_quality: int = 95) -> None:
-        self._jpg_quality = jpg_quality
+    _HEADER_SIZE_FORMAT = "<I"
+
+    def __init__(
+        self,
+        codec: ImageCodec | str = ImageCodec.JPEG,
+        *,
+        quality: int = 95,
+        max_size: int | None = None,
+        grayscale: bool = False,
+    ) -> None:
+        """
+        Args:
+            codec (ImageCodec | str, optional): The codec to encode images with.
+            quality (int, optional): The quality of JPEG and WebP, from 0 to 100. It is ignored by PNG, which uses the fastest compression, and by RAW.
+            max_size (int | None, optional): The maximum width and height of the sent images. Larger images are downscaled with their aspect ratio kept. If `None`, images are sent at full resolution.
+            grayscale (bool, optional): If `True`, color images are converted to grayscale before encoding. WebP has no grayscale mode, so they are encoded with 3 channels and converted back to grayscale when decoded.
+        """
+        self._codec = ImageCodec(codec)
+        self._quality = quality
+        self._max_size = max_size
+        self._grayscale = grayscale
+
+        self._encoder = Encoder()
+        self._decoder = Decoder(_ImageHeader)
 
     def serialize(self, obj: MatLike) -> bytes:
-        _, buf = cv2.imencode(self.ext, obj, [int(cv2.IMWRITE_JPEG_QUALITY), self._jpg_quality])
-        return buf.tobytes()
+        header, data = self.serialize_multipart(obj)
+        return struct.pack(self._HEADER_SIZE_FORMAT, len(header)) + bytes(header) + bytes(data)
 
     def deserialize(self, data: bytes) -> MatLike:
-        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), -1)
+        view = memoryview(data)
+        offset = struct.calcsize(self._HEADER_SIZE_FORMAT)
+        (header_size,) = struct.unpack_from(self._HEADER_SIZE_FORMAT, view)
+        return self.deserialize_multipart(
+            [view[offset : offset + header_size], view[offset + header_size :]]
+        )
+
+    def serialize_multipart(self, obj: MatLike) -> list[bytes | memoryview]:
+        image, scale = self._transform(obj)
+
+        if self._codec == ImageCodec.RAW:
+            image = np.ascontiguousarray(image)
+            header = _ImageHeader(
+                codec=self._codec,
+                scale=scale,
+                shape=image.shape,
+                dtype=image.dtype.str,
+                strides=image.strides,
+            )
+            return [self._encoder.encode(header), image.data.cast("B")]
+
+        _, buf = cv2.imencode(*self._get_encode_args(image))
+        header = _ImageHeader(codec=self._codec, scale=scale, grayscale=image.ndim == 2)
+        return [self._encoder.encode(header), buf.data]
+
+    def deserialize_multipart(self, parts: Sequence[memoryview]) -> MatLike:
+        image, _ = self.decode(parts)
+        return image
+
+    def decode(self, parts: Sequence[memoryview]) -> tuple[MatLike, float]:
+        """Deserialize an image with the scale applied by the sender.
+
+        Args:
+            parts (Sequence[memoryview]): The parts created by `serialize_multipart`.
+
+        Returns:
+            tuple[MatLike, float]: The image and its scale relative to the original image. Divide coordinates in the image by the scale to map them back to the original image.
+        """
+        header = self._decoder.decode(parts[0])
+        if header.codec == ImageCodec.RAW:
+            image = np.ndarray(
+                header.shape, dtype=np.dtype(header.dtype), buffer=parts[1], strides=header.strides
+            )
+            # The buffer may be shared with the sender, e.g. in-process, so the image must not be modified.
+            image.flags.writeable = False
+        else:
+            image = cv2.imdecode(np.frombuffer(parts[1], dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+            # Grayscale images come out of codecs without a grayscale mode, e.g. WebP, with 3 channels.
+            if header.grayscale and image.ndim == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return image, header.scale
+
+    def _transform(self, image: MatLike) -> tuple[MatLike, float]:
+        if self._grayscale and image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        scale = 1.0
+        height, width = image.shape[:2]
+        if self._max_size is not None and max(height, width) > self._max_size:
+            scale = self._max_size / max(height, width)
+            image = cv2.resize(
+                image,
+                (round(width * scale), round(height * scale)),
+                interpolation=cv2.INTER_AREA,
+            )
+        return image, scale
+
+    def _get_encode_args(self, image: MatLike) -> tuple[str, MatLike, list[int]]:
+        if self._codec == ImageCodec.WEBP:
+            return ".webp", image, [int(cv2.IMWRITE_WEBP_QUALITY), self._quality]
+        if self._codec == ImageCodec.PNG:
+            return ".png", image, [int(cv2.IMWRITE_PNG_COMPRESSION), 1]
+        return ".jpg", image, [int(cv2.IMWRITE_JPEG_QUALITY), self._quality]
+
+
+class RawImageSerializer(ImageSerializer):
+    """Serializer sending images as raw pixel buffers without encoding.
+
+    This is intended for links on the same host, where encoding costs more than copying.
+    With multipart transports, the pixel buffer is sent and received without being copied,
+    so deserialized images are read-only. Copy them before drawing on them.
+    """
+
+    def __init__(self, *, max_size: int | None = None, grayscale: bool = False) -> None:
+        super().__init__(ImageCodec.RAW, max_size=max_size, grayscale=grayscale)
@@ -0,0 +1,246 @@
+import secrets
+import struct
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from threading import Lock
+
+import msgspec
+import numpy as np
+from msgspec.msgpack import Decoder, Encoder
+
+from libs.types import Callback, MatLike
+
+from .base_pubsub import BasePublisher, BaseSubscriber, SubscriberStats
+from .base_serializer import BaseSerializer
+from .zmq_pubsub import ZmqPublisher, ZmqSubscriber
+
+# Layout of the shared memory block:
+#   ring header | slot header | slot data | slot header | slot data | ...
+# A slot header holds the sequence number of its frame, which is 0 while the frame is written.
+# The generation identifies the block, which is recreated under the same name when the publisher restarts.
+_RING_HEADER = struct.Struct(
+    "<QIQQ"
+)  # latest sequence number, number of slots, slot size, generation
+_SLOT_HEADER = struct.Struct("<QI3I8s")  # sequence number, ndim, shape, dtype
+_HEADER_SIZE = 64
+
+# Names of the blocks created in this process, which are tracked by the resource tracker already.
+_created_names: set[str] = set()
+
+
+class _SlotRef(msgspec.Struct, array_like=True):
+    slot: int
+    seq: int
+    generation: int
+
+
+class _SlotRefSerializer(BaseSerializer[_SlotRef]):
+    def __init__(self) -> None:
+        self._encoder = Encoder()
+        self._decoder = Decoder(_SlotRef)
+
+    def serialize(self, obj: _SlotRef) -> bytes:
+        return self._encoder.encode(obj)
+
+    def deserialize(self, data: bytes) -> _SlotRef:
+        return self._decoder.decode(data)
+
+
+class ShmFramePublisher(BasePublisher[MatLike]):
+    """Publisher writing frames into a ring of preallocated shared memory slots.
+
+    Only the slot index and the sequence number of each frame are sent over the control channel,
+    so frames are copied once into shared memory instead of going through a socket.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        control_addr: str,
+        *,
+        num_slots: int = 4,
+        slot_size: int = 1920 * 1080 * 3,
+    ) -> None:
+        """
+        Args:
+            name (str): The name of the shared memory block.
+            control_addr (str): The address to bind the control channel to.
+            num_slots (int, optional): The number of frames kept in the ring.
+            slot_size (int, optional): The maximum size in bytes of a frame.
+        """
+        size = _HEADER_SIZE + num_slots * (_HEADER_SIZE + slot_size)
+        try:
+            self._shm = SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a publisher which did not exit cleanly.
+            stale = SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self._shm = SharedMemory(name=name, create=True, size=size)
+        _created_names.add(name)
+        assert self._shm.buf is not None
+        self._buf: memoryview = self._shm.buf
+
+        self._name = name
+        self._num_slots = num_slots
+        self._slot_size = slot_size
+        self._seq = 0
+        self._generation = secrets.randbits(64)
+        self._write_ring_header()
+
+        self._control_publisher = ZmqPublisher(control_addr, name, _SlotRefSerializer())
+
+    def publish(self, msg: MatLike) -> None:
+        if self._shm.buf is None:
+            raise ValueError("Publisher is closed")
+
+        image = np.ascontiguousarray(msg)
+        if image.nbytes > self._slot_size:
+            raise ValueError(f"Frame of {image.nbytes} bytes exceeds slot size {self._slot_size}")
+        if image.ndim > 3:
+            raise ValueError(f"Expected at most 3 dimensions, got {image.ndim}")
+
+        self._seq += 1
+        slot = self._seq % self._num_slots
+        offset = _slot_offset(slot, self._slot_size)
+        shape = (*image.shape, *(0,) * (3 - image.ndim))
+
+        _SLOT_HEADER.pack_into(self._buf, offset, 0, 0, 0, 0, 0, b"")
+        data_offset = offset + _HEADER_SIZE
+        self._buf[data_offset : data_offset + image.nbytes] = image.data.cast("B")
+        _SLOT_HEADER.pack_into(
+            self._buf, offset, self._seq, image.ndim, *shape, image.dtype.str.encode()
+        )
+        self._write_ring_header()
+
+        self._control_publisher.publish(
+            _SlotRef(slot=slot, seq=self._seq, generation=self._generation)
+        )
+
+    def close(self) -> None:
+        self._control_publisher.close()
+        self._shm.close()
+        self._shm.unlink()
+        _created_names.discard(self._name)
+
+    def _write_ring_header(self) -> None:
+        _RING_HEADER.pack_into(
+            self._buf, 0, self._seq, self._num_slots, self._slot_size, self._generation
+        )
+
+
+class ShmFrameSubscriber(BaseSubscriber[MatLike]):
+    """Subscriber reading frames from the shared memory ring of a `ShmFramePublisher`.
+
+    On each notification, the newest complete frame is copied out of the ring and passed to the callback.
+    Frames overwritten before being read are counted as discarded. When the publisher restarts with a new block,
+    the subscriber attaches to the new block.
+    """
+
+    def __init__(self, name: str, control_addr: str) -> None:
+        """
+        Args:
+            name (str): The name of the shared memory block.
+            control_addr (str): The address to connect the control channel to.
+        """
+        self._name = name
+        self._shm: SharedMemory | None = None
+        self._buf: memoryview | None = None
+        self._generation = 0
+        self._last_seq = 0
+        self._lock = Lock()
+        self._delivered = 0
+        self._discarded = 0
+
+        self._control_subscriber = ZmqSubscriber(control_addr, name, _SlotRefSerializer())
+
+    def start(self, callback: Callback[MatLike]) -> None:
+        self._control_subscriber.start(lambda ref: self._on_notification(ref, callback))
+
+    @property
+    def stats(self) -> SubscriberStats:
+        with self._lock:
+            return SubscriberStats(
+                received=self._delivered + self._discarded,
+                delivered=self._delivered,
+                discarded=self._discarded,
+            )
+
+    def _on_notification(self, ref: _SlotRef, callback: Callback[MatLike]) -> None:
+        if self._buf is not None and ref.generation != self._generation:
+            # The publisher was restarted, and recreated the block with its sequence numbers reset.
+            self._detach()
+        buf = self._buf if self._buf is not None else self._attach()
+        if buf is None or ref.generation != self._generation:
+            return
+        if ref.seq <= self._last_seq:
+            # The newest frame is read on each notification, so the frame was already delivered or skipped.
+            return
+
+        while True:
+            latest_seq, num_slots, slot_size, _ = _RING_HEADER.unpack_from(buf, 0)
+            if latest_seq <= self._last_seq:
+                return
+
+            frame = self._read_slot(buf, latest_seq % num_slots, slot_size, latest_seq)
+            with self._lock:
+                if self._last_seq:
+                    self._discarded += latest_seq - self._last_seq - 1
+                self._last_seq = latest_seq
+                if frame is None:
+                    # Overwritten while being read, so retry with the newer frame.
+                    self._discarded += 1
+                    continue
+                self._delivered += 1
+            callback(frame)
+            return
+
+    def _attach(self) -> memoryview | None:
+        # The publisher creates the block, so it is attached on the first notification.
+        try:
+            shm = SharedMemory(name=self._name)
+        except FileNotFoundError:
+            # Notified by a publisher which has exited since.
+            return None
+        if self._name not in _created_names:
+            # Prevent the resource tracker from unlinking the block owned by the publisher.
+            resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+
+        assert shm.buf is not None
+        self._shm = shm
+        self._buf = shm.buf
+        *_, self._generation = _RING_HEADER.unpack_from(self._buf, 0)
+        self._last_seq = 0
+        return self._buf
+
+    def _detach(self) -> None:
+        if self._shm is not None:
+            self._shm.close()
+        self._shm = None
+        self._buf = None
+
+    def _read_slot(
+        self, buf: memoryview, slot: int, slot_size: int, expected_seq: int
+    ) -> MatLike | None:
+        offset = _slot_offset(slot, slot_size)
+        seq, ndim, *shape, dtype_str = _SLOT_HEADER.unpack_from(buf, offset)
+        if seq != expected_seq:
+            return None
+
+        frame = np.ndarray(
+            tuple(shape[:ndim]),
+            dtype=np.dtype(dtype_str.rstrip(b"\0").decode()),
+            buffer=buf,
+            offset=offset + _HEADER_SIZE,
+        ).copy()
+
+        seq, *_ = _SLOT_HEADER.unpack_from(buf, offset)
+        return frame if seq == expected_seq else None
+
+    def close(self) -> None:
+        self._control_subscriber.close()
+        self._detach()
+
+
+def _slot_offset(slot: int, slot_size: int) -> int:
+    return _HEADER_SIZE + slot * (_HEADER_SIZE + slot_size)
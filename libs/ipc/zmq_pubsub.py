@@ -1,71 +1,329 @@
-from threading import Thread
-from typing import TypeVar
+import asyncio
+from threading import Lock, Thread
+from typing import Any, Callable, Coroutine, TypeVar
 
 import zmq
+import zmq.asyncio
 
 from libs.types import Callback
 
-from .base_pubsub import BasePublisher, BaseSubscriber
+from .base_pubsub import BasePublisher, BaseSubscriber, StreamMsg, SubscriberStats
 from .base_serializer import BaseSerializer
 
 Msg = TypeVar("Msg")
 
 
+def stream_topic(topic: str, stream_id: str) -> str:
+    """Build the topic of a stream that belongs to the given base topic."""
+    return f"{topic}/{stream_id}"
+
+
 class ZmqPublisher(BasePublisher[Msg]):
-    def __init__(self, addr: str, topic: str, serializer: BaseSerializer[Msg]) -> None:
+    def __init__(
+        self,
+        addr: str,
+        topic: str,
+        serializer: BaseSerializer[Msg],
+        *,
+        sndhwm: int | None = None,
+        ctx: zmq.Context | None = None,
+    ) -> None:
+        """
+        Args:
+            addr (str): The address to bind the socket to.
+            topic (str): The topic of the published messages.
+            serializer (BaseSerializer[Msg]): The serializer of the messages.
+            sndhwm (int | None, optional): The maximum number of messages queued per subscriber. Messages published beyond this are dropped. If `None`, the ZMQ default is used.
+            ctx (zmq.Context | None, optional): The context to create the socket in. It must be the one of the subscribers to use `inproc://` addresses. If `None`, the process-wide context is used.
+        """
         self._topic = topic
 
-        self._ctx = zmq.Context()
+        self._ctx = ctx or zmq.Context.instance()
         self._socket = self._ctx.socket(zmq.PUB)
+        if sndhwm is not None:
+            self._socket.sndhwm = sndhwm
         self._socket.bind(addr)
+        self._lock = Lock()
 
         self._serializer = serializer
 
     def publish(self, msg: Msg) -> None:
+        self._send(self._topic, msg)
+
+    def for_stream(self, stream_id: str) -> BasePublisher[Msg]:
+        """Create a publisher for a stream of this topic, sharing the same socket.
+
+        Args:
+            stream_id (str): The stream id appended to the topic.
+
+        Returns:
+            BasePublisher[Msg]: The publisher of the stream. Closing it does not close the socket.
+        """
+        return _ZmqStreamPublisher(self, stream_topic(self._topic, stream_id))
+
+    def _send(self, topic: str, msg: Msg) -> None:
         if self._socket.closed:
             raise ValueError("Publisher is closed")
 
-        self._socket.send_multipart([self._topic.encode(), self._serializer.serialize(msg)])
+        parts = self._serializer.serialize_multipart(msg)
+        with self._lock:
+            self._socket.send_multipart([topic.encode(), *parts], copy=False)
 
     def close(self) -> None:
+        # The context may be shared with other sockets, so it is not terminated.
         self._socket.close()
-        self._ctx.term()
+
+
+class _ZmqStreamPublisher(BasePublisher[Msg]):
+    def __init__(self, parent: ZmqPublisher[Msg], topic: str) -> None:
+        self._parent = parent
+        self._topic = topic
+
+    def publish(self, msg: Msg) -> None:
+        self._parent._send(self._topic, msg)
+
+    def close(self) -> None:
+        # The socket is owned by the parent publisher.
+        pass
 
 
 class ZmqSubscriber(BaseSubscriber[Msg]):
-    def __init__(self, addr: str, topic: str, serializer: BaseSerializer[Msg]) -> None:
+    def __init__(
+        self,
+        addr: str,
+        topic: str,
+        serializer: BaseSerializer[Msg],
+        *,
+        latest_only: bool = False,
+        rcvhwm: int | None = None,
+        ctx: zmq.Context | None = None,
+    ) -> None:
+        """
+        Args:
+            addr (str): The address to connect the socket to.
+            topic (str): The topic of the subscribed messages.
+            serializer (BaseSerializer[Msg]): The serializer of the messages.
+            latest_only (bool, optional): If `True`, the queued messages are drained before calling the callback and only the newest one of each topic is delivered, so that a slow callback does not accumulate stale messages.
+            rcvhwm (int | None, optional): The maximum number of messages queued by the socket. Messages arriving beyond this are dropped. If `None`, the ZMQ default is used.
+            ctx (zmq.Context | None, optional): The context to create the socket in. It must be the one of the publisher to use `inproc://` addresses. If `None`, the process-wide context is used.
+        """
         self._topic = topic
+        self._latest_only = latest_only
         self._thread: Thread | None = None
         self._is_running = False
+        self._lock = Lock()
+        self._callbacks: dict[bytes, Callback[Msg]] = {}
+        self._received = 0
+        self._delivered = 0
 
-        self._ctx = zmq.Context()
+        self._ctx = ctx or zmq.Context.instance()
         self._socket = self._ctx.socket(zmq.SUB)
+        if rcvhwm is not None:
+            self._socket.rcvhwm = rcvhwm
         self._socket.connect(addr)
         self._socket.subscribe(topic.encode())
 
         self._serializer = serializer
 
     def start(self, callback: Callback[Msg]) -> None:
-        if self._is_running:
-            raise RuntimeError("Subscriber is already running")
+        self._register(self._topic, callback)
+
+    @property
+    def stats(self) -> SubscriberStats:
+        """The message counters of the socket, including all of its streams."""
+        with self._lock:
+            return SubscriberStats(
+                received=self._received,
+                delivered=self._delivered,
+                discarded=self._received - self._delivered,
+            )
+
+    def for_stream(self, stream_id: str) -> BaseSubscriber[Msg]:
+        """Create a subscriber for a stream of this topic, sharing the same socket.
+
+        Messages are dispatched to the subscriber whose topic matches exactly.
+
+        Args:
+            stream_id (str): The stream id appended to the topic.
+
+        Returns:
+            BaseSubscriber[Msg]: The subscriber of the stream. Closing it does not close the socket.
+        """
+        return _ZmqStreamSubscriber(self, stream_topic(self._topic, stream_id))
+
+    def _register(self, topic: str, callback: Callback[Msg]) -> None:
         if self._socket.closed:
             raise ValueError("Subscriber is closed")
 
-        self._is_running = True
-        self._thread = Thread(target=self._run, args=(callback,), daemon=True)
-        self._thread.start()
+        with self._lock:
+            if topic.encode() in self._callbacks:
+                raise RuntimeError("Subscriber is already running")
+            self._callbacks[topic.encode()] = callback
+
+            if not self._is_running:
+                self._is_running = True
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
 
-    def _run(self, callback: Callback[Msg]) -> None:
+    def _unregister(self, topic: str) -> None:
+        with self._lock:
+            self._callbacks.pop(topic.encode(), None)
+
+    def _run(self) -> None:
         poller = zmq.Poller()
         poller.register(self._socket, zmq.POLLIN)
         while self._is_running:
             if self._socket in dict(poller.poll(100)):
-                _, msg = self._socket.recv_multipart()
-                callback(self._serializer.deserialize(msg))
+                if self._latest_only:
+                    messages = self._recv_latest()
+                else:
+                    topic, *parts = self._socket.recv_multipart(copy=False)
+                    messages = {topic.bytes: parts}
+                    with self._lock:
+                        self._received += 1
+
+                for topic_bytes, parts in messages.items():
+                    callback = self._callbacks.get(topic_bytes)
+                    if callback:
+                        with self._lock:
+                            self._delivered += 1
+                        callback(
+                            self._serializer.deserialize_multipart([part.buffer for part in parts])
+                        )
+
+    def _recv_latest(self) -> dict[bytes, list[zmq.Frame]]:
+        # ZMQ_CONFLATE does not support multipart messages, so the queue is drained explicitly.
+        messages: dict[bytes, list[zmq.Frame]] = {}
+        received = 0
+        while True:
+            try:
+                topic, *parts = self._socket.recv_multipart(zmq.NOBLOCK, copy=False)
+            except zmq.Again:
+                break
+            messages[topic.bytes] = parts
+            received += 1
+
+        with self._lock:
+            self._received += received
+        return messages
 
     def close(self) -> None:
         self._is_running = False
         if self._thread and self._thread.is_alive():
             self._thread.join()
+        # The context may be shared with other sockets, so it is not terminated.
         self._socket.close()
-        self._ctx.term()
+
+
+class _ZmqStreamSubscriber(BaseSubscriber[Msg]):
+    def __init__(self, parent: ZmqSubscriber[Msg], topic: str) -> None:
+        self._parent = parent
+        self._topic = topic
+
+    def start(self, callback: Callback[Msg]) -> None:
+        self._parent._register(self._topic, callback)
+
+    def close(self) -> None:
+        # The socket is owned by the parent subscriber.
+        self._parent._unregister(self._topic)
+
+
+class AsyncZmqSubscriber(BaseSubscriber[Msg]):
+    """Subscriber receiving messages in the running asyncio event loop instead of a thread.
+
+    The callback is called in the event loop, so it must not block.
+    """
+
+    def __init__(
+        self,
+        addr: str,
+        topic: str,
+        serializer: BaseSerializer[Msg],
+        *,
+        ctx: zmq.Context | None = None,
+    ) -> None:
+        """
+        Args:
+            addr (str): The address to connect the socket to.
+            topic (str): The topic of the subscribed messages.
+            serializer (BaseSerializer[Msg]): The serializer of the messages.
+            ctx (zmq.Context | None, optional): The context to create the socket in, which is shadowed by an asyncio context. If `None`, the process-wide context is used.
+        """
+        self._topic = topic
+        self._task: asyncio.Task[None] | None = None
+
+        self._ctx = zmq.asyncio.Context(shadow=ctx or zmq.Context.instance())
+        self._socket = self._ctx.socket(zmq.SUB)
+        self._socket.connect(addr)
+        self._socket.subscribe(topic.encode())
+
+        self._serializer = serializer
+
+    def start(self, callback: Callback[Msg]) -> None:
+        """Begin receiving messages in the running event loop.
+
+        Raises:
+            RuntimeError: If this method is called more than once or outside of a running event loop.
+            ValueError: If the communication channel is already closed.
+        """
+        self._start(lambda: self._run(callback))
+
+    def for_all_streams(self) -> BaseSubscriber[StreamMsg[Msg]]:
+        """Create a subscriber for the messages of this topic and of all its streams, sharing the same socket.
+
+        Unlike `ZmqSubscriber.for_stream`, the streams do not need to be known in advance.
+        Either this subscriber or the returned one can be started, but not both.
+
+        Returns:
+            BaseSubscriber[StreamMsg[Msg]]: The subscriber of the messages tagged with their stream id. Closing it closes the socket.
+        """
+        return _AsyncZmqAllStreamsSubscriber(self)
+
+    def _start(self, run: Callable[[], Coroutine[Any, Any, None]]) -> None:
+        if self._socket.closed:
+            raise ValueError("Subscriber is closed")
+        if self._task is not None:
+            raise RuntimeError("Subscriber is already running")
+
+        self._task = asyncio.get_running_loop().create_task(run())
+
+    async def _run(self, callback: Callback[Msg]) -> None:
+        topic_bytes = self._topic.encode()
+        while True:
+            topic, *parts = await self._socket.recv_multipart(copy=False)
+            if topic.bytes == topic_bytes:
+                callback(self._deserialize(parts))
+
+    async def _run_all_streams(self, callback: Callback[StreamMsg[Msg]]) -> None:
+        topic_bytes = self._topic.encode()
+        stream_prefix = stream_topic(self._topic, "").encode()
+        while True:
+            topic, *parts = await self._socket.recv_multipart(copy=False)
+            if topic.bytes == topic_bytes:
+                stream_id = None
+            elif topic.bytes.startswith(stream_prefix):
+                stream_id = topic.bytes.removeprefix(stream_prefix).decode()
+            else:
+                # The subscription is a prefix, so other topics starting with this one arrive too.
+                continue
+            callback(StreamMsg(stream_id, self._deserialize(parts)))
+
+    def _deserialize(self, parts: list[zmq.Frame]) -> Msg:
+        return self._serializer.deserialize_multipart([part.buffer for part in parts])
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        # The context may be shared with other sockets, so it is not terminated.
+        self._socket.close()
+
+
+class _AsyncZmqAllStreamsSubscriber(BaseSubscriber[StreamMsg[Msg]]):
+    def __init__(self, parent: AsyncZmqSubscriber[Msg]) -> None:
+        self._parent = parent
+
+    def start(self, callback: Callback[StreamMsg[Msg]]) -> None:
+        self._parent._start(lambda: self._parent._run_all_streams(callback))
+
+    def close(self) -> None:
+        self._parent.close()
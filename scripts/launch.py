@@ -1,17 +1,29 @@
 import argparse
 from threading import Thread
+from typing import Collection
 
 from apps.local import App as LocalApp
+from apps.local import VideoSource
 from apps.processing import App as ProcessingApp
+from apps.processing import StreamEndpoints
 from apps.web import App as WebApp
-from libs.config import read_config
+from libs.config import Config, FrameCodecParameters, read_config
 from libs.ipc import (
     AnalysisMsgSerializer,
+    AsyncZmqSubscriber,
+    BaseSerializer,
+    ImageCodec,
     ImageSerializer,
     MonitorMsgSerializer,
+    ShmFramePublisher,
+    ShmFrameSubscriber,
     ZmqPublisher,
     ZmqSubscriber,
+    stream_topic,
 )
+from libs.types import MatLike
+
+SHM_ADDR_PREFIX = "shm:"
 
 
 def main() -> None:
@@ -20,66 +32,132 @@ def main() -> None:
     args = parser.parse_args()
 
     config = read_config(args.config)
+    inproc_addrs = get_inproc_addrs(config)
 
     monitor_msg_serializer = MonitorMsgSerializer()
     analysis_msg_serializer = AnalysisMsgSerializer()
-    frame_serializer = ImageSerializer()
 
     apps: list = []
 
     if config.web.enabled:
         web_params = config.web.parameters
-        monitor_msg_subscriber = ZmqSubscriber(
-            add_addr_prefix(web_params.monitor_subscriber_addr),
+        # A single socket receives the messages of all users, whose ids are the stream ids.
+        monitor_msg_subscriber = AsyncZmqSubscriber(
+            add_addr_prefix(web_params.monitor_subscriber_addr, inproc_addrs),
             web_params.monitor_topic,
             monitor_msg_serializer,
+        ).for_all_streams()
+        web_app = WebApp(
+            monitor_msg_subscriber,
+            evolution_threshold=web_params.evolution_threshold,
+            workers=web_params.workers,
+            live_addr=add_addr_prefix(web_params.live_addr),
         )
-        web_app = WebApp(monitor_msg_subscriber, evolution_threshold=web_params.evolution_threshold)
         apps.append((web_app, {"host": web_params.host, "port": web_params.port}))
 
     if config.local.enabled:
         local_params = config.local.parameters
+        # Without sources, the single source of the parameters is published on the topics of its stream id.
+        stream_id = None if local_params.sources else local_params.stream_id
         monitor_msg_publisher = ZmqPublisher(
-            add_addr_prefix(local_params.monitor_publisher_addr),
-            local_params.monitor_topic,
+            add_addr_prefix(local_params.monitor_publisher_addr, inproc_addrs),
+            get_local_topic(local_params.monitor_topic, stream_id),
             monitor_msg_serializer,
         )
-        frame_publisher = ZmqPublisher(
-            add_addr_prefix(local_params.frame_publisher_addr),
-            local_params.frame_topic,
-            frame_serializer,
+        frame_publisher = create_frame_publisher(
+            local_params.frame_publisher_addr,
+            get_local_topic(local_params.frame_topic, stream_id),
+            local_params.frame_codec,
+            hwm=local_params.frame_hwm,
+            inproc_addrs=inproc_addrs,
         )
         analysis_msg_subscriber = ZmqSubscriber(
-            add_addr_prefix(local_params.analysis_subscriber_addr),
-            local_params.analysis_topic,
+            add_addr_prefix(local_params.analysis_subscriber_addr, inproc_addrs),
+            get_local_topic(local_params.analysis_topic, stream_id),
             analysis_msg_serializer,
         )
+        if local_params.sources:
+            if not isinstance(frame_publisher, ZmqPublisher):
+                raise ValueError("Multiple sources are not supported over shared memory")
+            # The sources share the sockets, and each of them is published on the topics of its stream id.
+            sources = {
+                source.stream_id: VideoSource(
+                    source.video_path_or_device_id,
+                    monitor_msg_publisher.for_stream(source.stream_id),
+                    frame_publisher.for_stream(source.stream_id),
+                    analysis_msg_subscriber.for_stream(source.stream_id),
+                )
+                for source in local_params.sources
+            }
+        else:
+            sources = {
+                local_params.stream_id or "": VideoSource(
+                    local_params.video_path_or_device_id,
+                    monitor_msg_publisher,
+                    frame_publisher,
+                    analysis_msg_subscriber,
+                )
+            }
         local_app = LocalApp(
-            monitor_msg_publisher,
-            frame_publisher,
-            analysis_msg_subscriber,
-            video_path_or_device_id=local_params.video_path_or_device_id,
+            sources,
+            capture_prefetch_size=local_params.capture_prefetch_size,
+            replay_factor=local_params.replay_factor,
             max_buffer_size=local_params.max_buffer_size,
             ear_threshold=local_params.ear_threshold,
             looking_away_x_threshold=local_params.looking_away_x_threshold,
             looking_away_penalty=local_params.looking_away_penalty,
             head_direction_std_weight=local_params.head_direction_std_weight,
+            monitor_rate=local_params.monitor_rate,
+            monitor_change_threshold=local_params.monitor_change_threshold,
+            monitor_heartbeat_interval=local_params.monitor_heartbeat_interval,
         )
         apps.append((local_app, {}))
 
     if config.processing.enabled:
         processing_params = config.processing.parameters
-        frame_subscriber = ZmqSubscriber(
-            add_addr_prefix(processing_params.frame_subscriber_addr),
+        frame_subscriber = create_frame_subscriber(
+            processing_params.frame_subscriber_addr,
             processing_params.frame_topic,
-            frame_serializer,
+            hwm=processing_params.frame_hwm,
+            inproc_addrs=inproc_addrs,
         )
         analysis_publisher = ZmqPublisher(
-            add_addr_prefix(processing_params.analysis_publisher_addr),
+            add_addr_prefix(processing_params.analysis_publisher_addr, inproc_addrs),
             processing_params.analysis_topic,
             analysis_msg_serializer,
         )
-        processing_app = ProcessingApp(frame_subscriber, analysis_publisher)
+        overlay_publisher = None
+        if processing_params.overlay_publisher_addr:
+            overlay_publisher_addr = add_addr_prefix(
+                processing_params.overlay_publisher_addr, inproc_addrs
+            )
+            overlay_publisher = ZmqPublisher(
+                overlay_publisher_addr,
+                processing_params.overlay_topic,
+                create_frame_serializer(overlay_publisher_addr, processing_params.overlay_codec),
+            )
+        if processing_params.stream_ids:
+            if not isinstance(frame_subscriber, ZmqSubscriber):
+                raise ValueError("Multiple streams are not supported over shared memory")
+            streams = {
+                stream_id: StreamEndpoints(
+                    frame_subscriber.for_stream(stream_id),
+                    analysis_publisher.for_stream(stream_id),
+                    overlay_publisher.for_stream(stream_id) if overlay_publisher else None,
+                )
+                for stream_id in processing_params.stream_ids
+            }
+        else:
+            streams = {"": StreamEndpoints(frame_subscriber, analysis_publisher, overlay_publisher)}
+        processing_app = ProcessingApp(
+            streams,
+            face_redetect_interval=processing_params.face_redetect_interval,
+            max_batch_size=processing_params.max_batch_size,
+            pipeline_workers=processing_params.pipeline_workers,
+            pipeline_max_in_flight=processing_params.pipeline_max_in_flight,
+            headless=processing_params.headless,
+            overlay_max_fps=processing_params.overlay_max_fps,
+        )
         apps.append((processing_app, {}))
 
     threads = []
@@ -92,10 +170,95 @@ def main() -> None:
         thread.join()
 
 
-def add_addr_prefix(addr: str) -> str:
+def get_inproc_addrs(config: Config) -> set[str]:
+    """Find the addresses that are both bound and connected by the apps of this process."""
+    bound_addrs: set[str | None] = set()
+    connected_addrs: set[str | None] = set()
+    if config.web.enabled:
+        connected_addrs.add(config.web.parameters.monitor_subscriber_addr)
+    if config.local.enabled:
+        local_params = config.local.parameters
+        bound_addrs |= {local_params.monitor_publisher_addr, local_params.frame_publisher_addr}
+        connected_addrs.add(local_params.analysis_subscriber_addr)
+    if config.processing.enabled:
+        processing_params = config.processing.parameters
+        bound_addrs |= {
+            processing_params.analysis_publisher_addr,
+            processing_params.overlay_publisher_addr,
+        }
+        connected_addrs.add(processing_params.frame_subscriber_addr)
+    return {
+        addr
+        for addr in bound_addrs & connected_addrs
+        if addr is not None and not addr.startswith(SHM_ADDR_PREFIX)
+    }
+
+
+def get_local_topic(topic: str, stream_id: str | None) -> str:
+    # With a stream id, the local app is one of the users served by shared web and processing apps.
+    return topic if stream_id is None else stream_topic(topic, stream_id)
+
+
+def add_addr_prefix(addr: str, inproc_addrs: Collection[str] = ()) -> str:
+    # Apps in this process talk through the shared context without going through the kernel.
+    if addr in inproc_addrs:
+        return "inproc://" + addr
     prefix = "ipc://" if addr.startswith("/") else "tcp://"
     return prefix + addr
 
 
+def create_frame_publisher(
+    addr: str,
+    topic: str,
+    codec_params: FrameCodecParameters,
+    *,
+    hwm: int,
+    inproc_addrs: Collection[str] = (),
+) -> ZmqPublisher[MatLike] | ShmFramePublisher:
+    if addr.startswith(SHM_ADDR_PREFIX):
+        name = addr.removeprefix(SHM_ADDR_PREFIX)
+        return ShmFramePublisher(name, get_shm_control_addr(name))
+
+    addr = add_addr_prefix(addr, inproc_addrs)
+    return ZmqPublisher(addr, topic, create_frame_serializer(addr, codec_params), sndhwm=hwm)
+
+
+def create_frame_subscriber(
+    addr: str, topic: str, *, hwm: int, inproc_addrs: Collection[str] = ()
+) -> ZmqSubscriber[MatLike] | ShmFrameSubscriber:
+    if addr.startswith(SHM_ADDR_PREFIX):
+        name = addr.removeprefix(SHM_ADDR_PREFIX)
+        return ShmFrameSubscriber(name, get_shm_control_addr(name))
+
+    # The codec is read from the header of each frame, so any image serializer can decode them.
+    # Only the newest frame matters, so stale frames are dropped instead of building up latency.
+    return ZmqSubscriber(
+        add_addr_prefix(addr, inproc_addrs),
+        topic,
+        ImageSerializer(),
+        latest_only=True,
+        rcvhwm=hwm,
+    )
+
+
+def get_shm_control_addr(name: str) -> str:
+    return f"ipc:///tmp/{name}.ctrl"
+
+
+def create_frame_serializer(
+    addr: str, codec_params: FrameCodecParameters
+) -> BaseSerializer[MatLike]:
+    codec = codec_params.codec
+    if codec is None:
+        # Frames are not encoded on same-host links, where encoding costs more than copying.
+        codec = ImageCodec.RAW if addr.startswith(("ipc://", "inproc://")) else ImageCodec.JPEG
+    return ImageSerializer(
+        codec,
+        quality=codec_params.quality,
+        max_size=codec_params.max_size,
+        grayscale=codec_params.grayscale,
+    )
+
+
 if __name__ == "__main__":
     main()
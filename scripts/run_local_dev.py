@@ -1,6 +1,7 @@
 import cv2
 
 from apps.local import App as LocalApp
+from apps.local import VideoSource
 from libs.ipc import BasePublisher, BaseSubscriber
 from libs.schemas.analysis_msg import AnalysisMsg
 from libs.schemas.monitor_msg import MonitorMsg
@@ -33,12 +34,13 @@ def main() -> None:
     frame_publisher = DummyFramePublisher()
     monitor_msg_publisher = DummyMonitorMsgPublisher()
     analysis_msg_subscriber = DummyAnalysisMsgSubscriber()
-    app = LocalApp(
+    source = VideoSource(
+        "videos/head-pose-face-detection-male.mp4",
         monitor_msg_publisher,
         frame_publisher,
         analysis_msg_subscriber,
-        video_path_or_device_id="videos/head-pose-face-detection-male.mp4",
     )
+    app = LocalApp({"": source})
     app.run()
 
 
@@ -3,6 +3,7 @@ from threading import Thread
 
 import cv2
 
+from apps.processing import StreamEndpoints
 from apps.processing.app import App as ProcessingApp
 from libs.ipc import BasePublisher, BaseSubscriber
 from libs.schemas.analysis_msg import AnalysisMsg
@@ -51,7 +52,7 @@ class DummyAnalysisMsgPublisher(BasePublisher[AnalysisMsg]):
 def main() -> None:
     frame_subscriber = DummyFrameSubscriber("videos/head-pose-face-detection-male.mp4")
     analysis_msg_publisher = DummyAnalysisMsgPublisher()
-    app = ProcessingApp(frame_subscriber, analysis_msg_publisher)
+    app = ProcessingApp({"": StreamEndpoints(frame_subscriber, analysis_msg_publisher)})
     app.run()
 
 
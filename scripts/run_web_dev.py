@@ -5,31 +5,33 @@ from random import random
 from threading import Thread
 
 from apps.web import App
-from libs.ipc import BaseSubscriber
+from libs.ipc import BaseSubscriber, StreamMsg
 from libs.schemas.monitor_msg import ConcentrationStatus, MonitorMsg, PenaltyFactor
 from libs.types import Callback
 
 
-class FakeSubscriber(BaseSubscriber[MonitorMsg]):
-    def __init__(self) -> None:
+class FakeSubscriber(BaseSubscriber[StreamMsg[MonitorMsg]]):
+    def __init__(self, user_ids: list[str | None]) -> None:
+        self._user_ids = user_ids
         self._thread: Thread | None = None
         self._is_running = False
 
-    def start(self, callback: Callback[MonitorMsg]) -> None:
+    def start(self, callback: Callback[StreamMsg[MonitorMsg]]) -> None:
         self._is_running = True
         self._thread = Thread(target=self._run, args=(callback,), daemon=True)
         self._thread.start()
 
-    def _run(self, callback: Callback[MonitorMsg]) -> None:
+    def _run(self, callback: Callback[StreamMsg[MonitorMsg]]) -> None:
         while self._is_running:
-            msg = MonitorMsg(
-                timestamp=datetime.datetime.now(),
-                payload=ConcentrationStatus(
-                    overall_score=random() * 100,
-                    penalty_factor=PenaltyFactor.NONE,
-                ),
-            )
-            callback(msg)
+            for user_id in self._user_ids:
+                msg = MonitorMsg(
+                    timestamp=datetime.datetime.now(),
+                    payload=ConcentrationStatus(
+                        overall_score=random() * 100,
+                        penalty_factor=PenaltyFactor.NONE,
+                    ),
+                )
+                callback(StreamMsg(user_id, msg))
             time.sleep(2)
 
     def close(self) -> None:
@@ -41,10 +43,17 @@ class FakeSubscriber(BaseSubscriber[MonitorMsg]):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--evolution-threshold", type=float, default=5000)
+    parser.add_argument("--users", type=str, nargs="*", default=[])
+    parser.add_argument("--workers", type=int, default=1)
     args = parser.parse_args()
 
-    subscriber = FakeSubscriber()
-    app = App(subscriber, evolution_threshold=args.evolution_threshold)
+    subscriber = FakeSubscriber([None, *args.users])
+    app = App(
+        subscriber,
+        evolution_threshold=args.evolution_threshold,
+        workers=args.workers,
+        live_addr="ipc:///tmp/sozo_web_live_dev",
+    )
     app.run("0.0.0.0", 8080, log_level="debug")
 
 